@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 
 from settings.config import Config
 from utils.logger import LogManager
@@ -19,6 +20,28 @@ def fetch_tokens():
     print(f"Input Token: {input_token}")
     fetch.search(input_token)
 
+def bulk_search(input_file_path: str, output_file_path: (str | None) = None, top_k: int = 10):
+    with open(input_file_path, "r") as queries:
+        if output_file_path is None:
+            return fetch.bulk_search(queries, sys.stdout, top_k)
+        with open(output_file_path, "w") as output:
+            return fetch.bulk_search(queries, output, top_k)
+
+def calibrate():
+    from fetch import calibration
+    calibration_table = calibration.build_calibration(fetch.SEARCH_PARAMS["radius"])
+    for (length_bucket, is_repetitive), params in sorted(calibration_table.items()):
+        print(f"length: {length_bucket:>5} repetitive: {is_repetitive!s:>5} radius: {params['radius']:.2f} limit: {params['limit']:>5} expected results: {params['expected_results']}")
+
+def federated_search(query: str, collection_names: list[str], top_k: int = 10, timeout: (float | None) = None):
+    return fetch.federated_search(query, collection_names, top_k=top_k, timeout=timeout)
+
+def maintenance(collection_names: (list[str] | None) = None, apply: bool = False):
+    import pandas as pd
+    from tabulate import tabulate
+    from database.maintenance import CollectionMaintenance
+    report = CollectionMaintenance().report(collection_names, apply)
+    print(tabulate(pd.DataFrame.from_dict(report), headers='keys', tablefmt='psql', showindex=False))
 
 def main():
     init()
@@ -28,5 +51,38 @@ def main():
     ]
     datagen.run(files)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="DocVecStore")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bulk_search_parser = subparsers.add_parser("bulk-search", help="search every line of a file as a query and write JSON Lines")
+    bulk_search_parser.add_argument("input", help="file with one query per line")
+    bulk_search_parser.add_argument("-o", "--output", default=None, help="output file, defaults to stdout")
+    bulk_search_parser.add_argument("-k", "--top-k", type=int, default=10, help="number of pages per query")
+
+    subparsers.add_parser("calibrate", help="rebuild the similarity radius calibration from the ingested vocabulary")
+
+    federated_search_parser = subparsers.add_parser("federated-search", help="search several collections concurrently and merge their pages")
+    federated_search_parser.add_argument("query", help="input query")
+    federated_search_parser.add_argument("collections", nargs="+", help="collections to be searched")
+    federated_search_parser.add_argument("-k", "--top-k", type=int, default=10, help="number of pages across all the collections")
+    federated_search_parser.add_argument("-t", "--timeout", type=float, default=None, help="seconds allowed for the search of each collection")
+
+    maintenance_parser = subparsers.add_parser("maintenance", help="report the compaction, index and load state of the collections")
+    maintenance_parser.add_argument("collections", nargs="*", help="collections to be reported, defaults to all the collections")
+    maintenance_parser.add_argument("--apply", action="store_true", help="compact and rebuild the indexes of the collections that are due")
+
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    fetch_tokens()
+    args = parse_args()
+    if args.command == "bulk-search":
+        bulk_search(args.input, args.output, args.top_k)
+    elif args.command == "calibrate":
+        calibrate()
+    elif args.command == "federated-search":
+        federated_search(args.query, args.collections, args.top_k, args.timeout)
+    elif args.command == "maintenance":
+        maintenance(args.collections, args.apply)
+    else:
+        fetch_tokens()
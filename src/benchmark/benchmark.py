@@ -0,0 +1,460 @@
+import io
+import os
+import sys
+import time
+import logging
+import tempfile
+import contextlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from settings.config import Config
+from utils.logger import LogManager
+
+Config(os.environ.get("CONFIG_FILE_PATH"))
+LogManager("benchmark")
+
+import pandas as pd
+from tabulate import tabulate
+
+from datagen import datagen
+from datagen import initialize
+from datagen import snapshot
+from datagen.parse_pdf import PDF
+from fetch import fetch
+from fetch import calibration
+from datagen.token_stats import TokenStatistics
+from database.milvus_client import MilvusDBClient
+from database.client_pool import MilvusClientPool
+from database.maintenance import CollectionMaintenance
+from embeddings.unigram_embeddings import vectorize
+
+SAMPLE_FILES = [
+    ("Competitive Programming HandBook.pdf", "Competitive Programming HandBook.txt", 13, 289),
+    ("Art Of Computer Programming.pdf", "Art Of Computer Programming.txt", 23, 487),
+]
+
+SAMPLE_QUERIES = [
+    "dijkstra shortest path", "binary search", "dynamic programming", "segment tree", "graph algorithm",
+    "sorting algorithm", "random numbers", "binary tree", "hash table", "linked list",
+    "prime numbers", "greedy algorithm", "bit manipulation", "minimum spanning tree", "topological sort",
+    "string matching", "number theory", "shortest path", "tree traversal", "complexity analysis",
+]
+
+def _print_report(rows: list[dict]) -> None:
+    dataframe = pd.DataFrame.from_dict(rows)
+    print(tabulate(dataframe, headers='keys', tablefmt='psql', showindex=False))
+
+@contextlib.contextmanager
+def _count_search_requests():
+
+    '''
+    Counts the search requests sent through `MilvusDBClient.search` and the result rows they returned while the context is active
+    '''
+
+    counter = {"requests": 0, "rows": 0}
+    original_search = MilvusDBClient.search
+
+    def counted_search(self, *args, **kwargs):
+        counter["requests"] += 1
+        results = original_search(self, *args, **kwargs)
+        counter["rows"] += sum(len(vector_results) for vector_results in results)
+        return results
+
+    MilvusDBClient.search = counted_search
+    try:
+        yield counter
+    finally:
+        MilvusDBClient.search = original_search
+
+def snapshot_rebuild_vs_reingest(files: list[tuple] = SAMPLE_FILES) -> list[dict]:
+
+    '''
+    Compares the time taken to rebuild the collection from snapshots against a full ingestion of the PDFs, per book
+    '''
+
+    rows = list()
+
+    for _tuple in files:
+        book_name = PDF(*_tuple).file_name
+
+        initialize.reset_collection()
+        initialize.init_collection()
+        start = time.perf_counter()
+        datagen.run([_tuple])
+        reingest_time = time.perf_counter() - start
+
+        initialize.reset_collection()
+        initialize.init_collection()
+        start = time.perf_counter()
+        documents = snapshot.load_snapshot(book_name)
+        rebuild_time = time.perf_counter() - start
+
+        rows.append({
+            "book_name": book_name,
+            "documents": documents,
+            "reingest_s": round(reingest_time, 3),
+            "snapshot_rebuild_s": round(rebuild_time, 3),
+            "speedup": round(reingest_time / rebuild_time, 2) if rebuild_time > 0 else None,
+        })
+
+    _print_report(rows)
+    return rows
+
+def bulk_search_vs_loop(queries: list[str] = SAMPLE_QUERIES) -> list[dict]:
+
+    '''
+    Compares the queries per second of `fetch.bulk_search` against calling `fetch.search` for every query,
+    a first query loads the collection so that neither mode pays for it
+    '''
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetch.search(queries[0])
+
+        start = time.perf_counter()
+        for query in queries:
+            fetch.search(query)
+        loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fetch.bulk_search(queries, io.StringIO())
+    bulk_time = time.perf_counter() - start
+
+    rows = [
+        {"mode": "fetch.search loop", "queries": len(queries), "seconds": round(loop_time, 3), "queries_per_s": round(len(queries) / loop_time, 2)},
+        {"mode": "fetch.bulk_search", "queries": len(queries), "seconds": round(bulk_time, 3), "queries_per_s": round(len(queries) / bulk_time, 2)},
+    ]
+    _print_report(rows)
+    return rows
+
+def two_stage_recall(queries: list[str] = SAMPLE_QUERIES, top_k: int = 10) -> list[dict]:
+
+    '''
+    Compares the pages returned by the two stage search against the exhaustive search, recall is the fraction of the exhaustive pages
+    that are also found by the two stage search, `top_k` recall is the fraction of the `top_k` best ranked exhaustive pages
+    '''
+
+    rows = list()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for query in queries:
+            start = time.perf_counter()
+            exhaustive_ranking = [(result["book_name"], result["page_number"]) for result in fetch.search(query, two_stage=False)]
+            exhaustive_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            two_stage_pages = {(result["book_name"], result["page_number"]) for result in fetch.search(query, two_stage=True)}
+            two_stage_time = time.perf_counter() - start
+
+            exhaustive_pages = set(exhaustive_ranking)
+            top_pages = set(exhaustive_ranking[:top_k])
+
+            rows.append({
+                "query": query,
+                "exhaustive_pages": len(exhaustive_pages),
+                "two_stage_pages": len(two_stage_pages),
+                "recall": round(len(exhaustive_pages & two_stage_pages) / len(exhaustive_pages), 3) if exhaustive_pages else None,
+                f"top_{top_k}_recall": round(len(top_pages & two_stage_pages) / len(top_pages), 3) if top_pages else None,
+                "exhaustive_ms": round(exhaustive_time * 1000, 1),
+                "two_stage_ms": round(two_stage_time * 1000, 1),
+            })
+
+    _print_report(rows)
+    return rows
+
+def conjunctive_vs_union(queries: list[str] = SAMPLE_QUERIES) -> list[dict]:
+
+    '''
+    Compares the search requests and latency of the conjunctive query mode against the union mode for multi token queries,
+    a first query loads the collection so that neither mode pays for it
+    '''
+
+    rows = list()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        fetch.search(queries[0])
+
+        for query in queries:
+            row = {"query": query}
+            for mode in fetch.QueryMode:
+                with _count_search_requests() as counter:
+                    start = time.perf_counter()
+                    results = fetch.search(query, mode=mode)
+                    row[f"{mode.value}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                row[f"{mode.value}_requests"] = counter["requests"]
+                row[f"{mode.value}_pages"] = len(results)
+            rows.append(row)
+
+    _print_report(rows)
+    return rows
+
+def adaptive_radius_by_length(tokens_per_bucket: int = 20) -> list[dict]:
+
+    '''
+    Compares the number of result rows returned by the search and the latency per token length bucket of the fixed radius
+    against the calibrated radius, the tokens are sampled from the ingested vocabulary and a first search loads the collection
+    so that neither radius pays for it
+    '''
+
+    radius_calibration = calibration.RadiusCalibration()
+    bucket_tokens = dict()
+
+    for token in TokenStatistics().collection_frequency:
+        bucket = calibration.length_bucket(token)
+        if bucket not in bucket_tokens:
+            bucket_tokens[bucket] = list()
+        if len(bucket_tokens[bucket]) < tokens_per_bucket:
+            bucket_tokens[bucket].append(token)
+
+    rows = list()
+
+    with MilvusClientPool().acquire() as db_client, CollectionMaintenance().loaded(db_client):
+        fetch._search_vectors(db_client, [vectorize(SAMPLE_QUERIES[0].split()[0])])
+
+        for bucket, tokens in bucket_tokens.items():
+            row = {"length": bucket, "tokens": len(tokens)}
+            for name, lookup in (
+                ("fixed", lambda token: (fetch.SEARCH_PARAMS["radius"], fetch.MAX_RESULTS)),
+                ("adaptive", lambda token: radius_calibration.lookup(token, fetch.SEARCH_PARAMS["radius"], fetch.MAX_RESULTS)),
+            ):
+                results = list()
+                latencies = list()
+                for token in tokens:
+                    radius, max_results = lookup(token)
+                    with _count_search_requests() as counter:
+                        start = time.perf_counter()
+                        fetch._search_vectors(db_client, [vectorize(token)], max_results=[max_results], radii=[radius])
+                        latencies.append(time.perf_counter() - start)
+                    results.append(counter["rows"])
+                row[f"{name}_mean_results"] = round(sum(results) / len(results), 1)
+                row[f"{name}_max_results"] = max(results)
+                row[f"{name}_mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 1)
+            rows.append(row)
+
+    _print_report(rows)
+    return rows
+
+def noisy_ingestion_logging(tokens: int = 200000, noise_ratio: float = 0.2) -> list[dict]:
+
+    '''
+    Compares the vectorization time of a noisy token stream, as in the ingestion loop, with the aggregated queue based logging against
+    a synchronous file and console write for every invalid token as it was done before
+    '''
+
+    words = [word for query in SAMPLE_QUERIES for word in query.split()]
+    noisy_words = [f"{word}\u7b97\u6cd5" for word in words]
+    noisy_every = max(1, round(1 / noise_ratio))
+    token_stream = [noisy_words[idx % len(noisy_words)] if idx % noisy_every == 0 else words[idx % len(words)] for idx in range(tokens)]
+
+    def ingest():
+        start = time.perf_counter()
+        for token in token_stream:
+            try:
+                vectorize(token)
+            except ValueError:
+                continue
+        return time.perf_counter() - start
+
+    rows = list()
+
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as console:
+        synchronous_logger = logging.getLogger("benchmark_synchronous")
+        synchronous_logger.propagate = False
+        file_handler = logging.FileHandler(filename=f"{log_dir}/synchronous.log")
+        console_handler = logging.StreamHandler(console)
+        console_handler.setLevel(logging.ERROR)
+        synchronous_logger.addHandler(file_handler)
+        synchronous_logger.addHandler(console_handler)
+
+        original_aggregate = LogManager.aggregate
+        LogManager.aggregate = lambda self, error_type, sample: synchronous_logger.error(f"{error_type}: {sample}")
+        try:
+            rows.append({"logging": "synchronous per error", "tokens": tokens, "seconds": round(ingest(), 3)})
+        finally:
+            LogManager.aggregate = original_aggregate
+            synchronous_logger.removeHandler(file_handler)
+            synchronous_logger.removeHandler(console_handler)
+            file_handler.close()
+
+    rows.append({"logging": "queued with aggregation", "tokens": tokens, "seconds": round(ingest(), 3)})
+
+    _print_report(rows)
+    return rows
+
+def concurrent_search_clients(queries: list[str] = SAMPLE_QUERIES, rounds: int = 5) -> list[dict]:
+
+    '''
+    Compares the search throughput of threads sharing a single client, as with the former singleton client, against threads
+    acquiring clients from the pool, the number of threads is the pool size and a first search loads the collection so that neither mode pays for it
+    '''
+
+    pool = MilvusClientPool()
+    single_client = MilvusDBClient()
+    query_vectors = [[vectorize(token) for token in query.split()] for query in queries * rounds]
+
+    def search_single(vectors):
+        fetch._search_vectors(single_client, vectors)
+
+    def search_pooled(vectors):
+        with pool.acquire() as db_client:
+            fetch._search_vectors(db_client, vectors)
+
+    rows = list()
+
+    with CollectionMaintenance().loaded(single_client):
+        search_single(query_vectors[0])
+
+        for name, search_function in (("single client", search_single), (f"pool of {pool.size}", search_pooled)):
+            with ThreadPoolExecutor(max_workers=pool.size) as executor:
+                start = time.perf_counter()
+                list(executor.map(search_function, query_vectors))
+                elapsed = time.perf_counter() - start
+            rows.append({"clients": name, "threads": pool.size, "queries": len(query_vectors), "seconds": round(elapsed, 3), "queries_per_s": round(len(query_vectors) / elapsed, 2)})
+
+    _print_report(rows)
+    return rows
+
+def duplicate_page_ingestion(files: list[tuple] = SAMPLE_FILES) -> list[dict]:
+
+    '''
+    Compares the rows stored and the time taken by the ingestion with and without the duplicate page detection and header and footer stripping
+    '''
+
+    dedup_config = Config().get_instance()["DEDUP"]
+    dedup_enabled = dedup_config["ENABLED"]
+    rows = list()
+
+    try:
+        for enabled in (False, True):
+            dedup_config["ENABLED"] = enabled
+            initialize.reset_collection()
+            initialize.init_collection()
+            start = time.perf_counter()
+            summary = datagen.run(files)
+            elapsed = time.perf_counter() - start
+
+            rows.append({
+                "dedup": enabled,
+                "pages": summary.get("pages", 0),
+                "duplicate_pages": summary.get("duplicate_pages", 0),
+                "stripped_lines": summary.get("stripped_lines", 0),
+                "rows": summary.get("rows", 0),
+                "seconds": round(elapsed, 3),
+            })
+    finally:
+        dedup_config["ENABLED"] = dedup_enabled
+
+    baseline, deduplicated = rows
+    deduplicated["rows_saved"] = round(1 - deduplicated["rows"] / baseline["rows"], 4) if baseline["rows"] else None
+    deduplicated["time_saved"] = round(1 - deduplicated["seconds"] / baseline["seconds"], 4) if baseline["seconds"] else None
+
+    _print_report(rows)
+    return rows
+
+def federated_vs_serial(queries: list[str] = SAMPLE_QUERIES[:5], collection_counts: tuple = (1, 2, 4, 8), book_file: tuple = SAMPLE_FILES[0]) -> list[dict]:
+
+    '''
+    Compares the latency of `fetch.federated_search` against calling `fetch.search` for every collection as the number of collections grows,
+    the collections are filled from the snapshot of a book and dropped afterwards
+    '''
+
+    book_name = PDF(*book_file).file_name
+    collection_names = [f"federated_benchmark_{idx}" for idx in range(max(collection_counts))]
+    rows = list()
+
+    with MilvusClientPool().acquire() as db_client:
+        existing_collections = db_client.list_all_collections()
+        for collection_name in collection_names:
+            if collection_name not in existing_collections:
+                db_client.create_collection(collection_name)
+                snapshot.load_snapshot(book_name, collection_name)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for collection_name in collection_names:
+                fetch.search(queries[0], collection_name=collection_name)
+
+            for collection_count in collection_counts:
+                searched_collections = collection_names[:collection_count]
+
+                start = time.perf_counter()
+                for query in queries:
+                    for collection_name in searched_collections:
+                        fetch.search(query, collection_name=collection_name)
+                serial_time = (time.perf_counter() - start) / len(queries)
+
+                start = time.perf_counter()
+                for query in queries:
+                    fetch.federated_search(query, searched_collections)
+                federated_time = (time.perf_counter() - start) / len(queries)
+
+                rows.append({
+                    "collections": collection_count,
+                    "serial_ms": round(serial_time * 1000, 2),
+                    "federated_ms": round(federated_time * 1000, 2),
+                    "speedup": round(serial_time / federated_time, 2) if federated_time > 0 else None,
+                })
+    finally:
+        with MilvusClientPool().acquire() as db_client:
+            for collection_name in collection_names:
+                db_client.delete_collection(collection_name)
+                db_client.delete_collection(db_client.page_collection_name(collection_name))
+
+    _print_report(rows)
+    return rows
+
+def federated_slow_collection(delays: tuple = (0.5, 3.0, 10.0), timeout: float = 1.0, query: str = SAMPLE_QUERIES[0]) -> list[dict]:
+
+    '''
+    Measures the latency of `fetch.federated_search` over the test collection and a collection whose search takes `delays` seconds,
+    the slow collection is simulated and does not exist in the database, the search should return within `timeout` whatever the delay
+    '''
+
+    slow_collection = "federated_slow_collection"
+    searched_collections = [Config().get_instance()["MILVUS"]["TEST_COLLECTION"], slow_collection]
+    original_search_pages = fetch._search_pages
+    rows = list()
+
+    for delay in delays:
+        def slow_search_pages(db_client, *args, **kwargs):
+            if db_client.collection_name == slow_collection:
+                time.sleep(delay)
+                return list()
+            return original_search_pages(db_client, *args, **kwargs)
+
+        fetch._search_pages = slow_search_pages
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                results, failures = fetch.federated_search(query, searched_collections, timeout=timeout)
+                elapsed = time.perf_counter() - start
+        finally:
+            fetch._search_pages = original_search_pages
+
+        rows.append({
+            "delay_s": delay,
+            "timeout_s": timeout,
+            "elapsed_s": round(elapsed, 3),
+            "results": len(results),
+            "failures": ",".join(f"{collection_name}: {error}" for collection_name, error in failures.items()),
+        })
+
+    _print_report(rows)
+    return rows
+
+BENCHMARKS = {
+    "snapshot": snapshot_rebuild_vs_reingest,
+    "bulk-search": bulk_search_vs_loop,
+    "two-stage": two_stage_recall,
+    "conjunctive": conjunctive_vs_union,
+    "adaptive-radius": adaptive_radius_by_length,
+    "logging": noisy_ingestion_logging,
+    "client-pool": concurrent_search_clients,
+    "dedup": duplicate_page_ingestion,
+    "federated": federated_vs_serial,
+    "federated-timeout": federated_slow_collection,
+}
+
+if __name__ == "__main__":
+    for benchmark_name in (sys.argv[1:] or BENCHMARKS.keys()):
+        BENCHMARKS[benchmark_name]()
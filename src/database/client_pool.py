@@ -0,0 +1,146 @@
+import time
+import queue
+import threading
+import contextlib
+
+from pymilvus import MilvusClient, connections
+
+from settings.config import Config
+from utils.singleton import Singleton
+from utils.logger import LogManager
+from database.milvus_client import MilvusDBClient
+
+logger = LogManager().get_logger("database")
+
+class MilvusClientPool(metaclass=Singleton):
+
+    '''
+    Thread safe pool of connections to MilvusDB, connections are opened lazily up to `MILVUS.POOL_SIZE`
+    and handed out as clients bound to a collection, so concurrent operations on different collections do not share any state
+
+    A connection that was idle for more than `MILVUS.HEALTH_CHECK_INTERVAL` seconds, or that was in use when an error occurred,
+    is checked before it is handed out again and is replaced when the check fails, a connection that cannot be opened gives its slot
+    back to the threads waiting for a connection
+    '''
+
+    def __init__(self) -> None:
+        config_dict = Config().get_instance()
+        self._uri = f"http://{config_dict['MILVUS']['HOST']}:{config_dict['MILVUS']['PORT']}"
+        self._db_name = config_dict["MILVUS"]["DB"]
+        self._size = config_dict["MILVUS"]["POOL_SIZE"]
+        self._health_check_interval = config_dict["MILVUS"]["HEALTH_CHECK_INTERVAL"]
+        self._idle_clients = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+        connections.connect(db_name=self._db_name, host=config_dict["MILVUS"]["HOST"], port=config_dict["MILVUS"]["PORT"])
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _open_client(self) -> MilvusClient:
+        return MilvusClient(uri=self._uri, db_name=self._db_name)
+
+    @staticmethod
+    def _is_healthy(client: MilvusClient) -> bool:
+        try:
+            client.list_collections()
+            return True
+        except Exception as e:
+            logger.error(f"Connection health check failed due to {e}")
+            return False
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._opened -= 1
+        self._idle_clients.put(None)
+
+    def _open_slot(self) -> MilvusClient:
+        try:
+            return self._open_client()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _checkout(self, timeout: (float | None)) -> MilvusClient:
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            try:
+                entry = self._idle_clients.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self._size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    return self._open_slot()
+                try:
+                    entry = self._idle_clients.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    logger.error(f"No connection available in the pool after {timeout} seconds")
+                    raise ValueError(f"No connection available in the pool after {timeout} seconds")
+
+            # a connection that could not be opened frees its slot and wakes a waiting thread to open a new one
+            if entry is not None:
+                break
+
+        client, last_used, needs_check = entry
+
+        if (needs_check or time.monotonic() - last_used > self._health_check_interval) and not self._is_healthy(client):
+            logger.info("Reconnecting unhealthy connection")
+            with contextlib.suppress(Exception):
+                client.close()
+            return self._open_slot()
+
+        return client
+
+    def _checkin(self, client: MilvusClient, needs_check: bool = False) -> None:
+        self._idle_clients.put((client, time.monotonic(), needs_check))
+
+    @contextlib.contextmanager
+    def acquire(self, collection_name: (str | None) = None, timeout: (float | None) = None):
+
+        '''
+        Hands out a client bound to `collection_name` for the duration of the context, the connection is returned to the pool afterwards
+
+        Parameters
+        ---------------------------------------------------
+        `collection_name`: collection the client is bound to, defaults to `MILVUS.TEST_COLLECTION` of the config
+        `timeout`: seconds to wait for a connection when all of them are in use, waits indefinitely by default
+
+        Returns
+        ---------------------------------------------------
+        context manager yielding a `MilvusDBClient`
+        '''
+
+        client = self._checkout(timeout)
+        failed = False
+
+        try:
+            yield MilvusDBClient(collection_name, client=client)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._checkin(client, needs_check=failed)
+
+    def close(self) -> None:
+
+        '''
+        Closes all the idle connections of the pool
+        '''
+
+        while True:
+            try:
+                entry = self._idle_clients.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                continue
+            client, _, _ = entry
+            with contextlib.suppress(Exception):
+                client.close()
+            with self._lock:
+                self._opened -= 1
@@ -0,0 +1,142 @@
+import os
+import time
+import fcntl
+import atexit
+import pickle
+import pathlib
+import threading
+
+from settings.config import Config
+from utils.singleton import Singleton
+
+USE_SAVE_INTERVAL = 5
+
+class CollectionStatistics(metaclass=Singleton):
+
+    '''
+    Rows inserted since the last index build, rows deleted since the last compaction and the time of the last search of every collection,
+    updated by `MilvusDBClient`
+
+    The changes of this process are kept as deltas and merged into the statistics file under a file lock, so that processes ingesting
+    into the same collections add up their counts instead of overwriting each other, inserts, deletes and resets are saved as they happen
+    and the search times at most every `USE_SAVE_INTERVAL` seconds and when the process exits
+    '''
+
+    def __init__(self) -> None:
+        self._pending: dict = dict()
+        self._lock = threading.Lock()
+        self._last_save = time.monotonic()
+
+        atexit.register(self.save)
+
+    @staticmethod
+    def stats_path() -> pathlib.Path:
+        return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["PICKLE_DIR"]), pathlib.Path("collection_stats.pkl"))
+
+    @staticmethod
+    def _read() -> dict:
+        stats_path = CollectionStatistics.stats_path()
+        if not stats_path.exists():
+            return dict()
+
+        with open(stats_path, "rb") as b_file:
+            return pickle.load(b_file)
+
+    def _delta(self, collection_name: str) -> dict:
+        if collection_name not in self._pending:
+            self._pending[collection_name] = {"inserted": 0, "deleted": 0, "last_used": None, "reset_inserted": False, "reset_deleted": False, "forget": False}
+        return self._pending[collection_name]
+
+    def _merge(self, collections: dict) -> dict:
+        for collection_name, delta in self._pending.items():
+            if delta["forget"]:
+                collections.pop(collection_name, None)
+                if not (delta["inserted"] or delta["deleted"] or delta["last_used"] or delta["reset_inserted"] or delta["reset_deleted"]):
+                    continue
+
+            if collection_name not in collections:
+                collections[collection_name] = {"inserted": 0, "deleted": 0, "last_used": None}
+            entry = collections[collection_name]
+
+            if delta["reset_inserted"]:
+                entry["inserted"] = 0
+            if delta["reset_deleted"]:
+                entry["deleted"] = 0
+            entry["inserted"] += delta["inserted"]
+            entry["deleted"] += delta["deleted"]
+            if delta["last_used"] is not None:
+                entry["last_used"] = max(entry["last_used"] or 0, delta["last_used"])
+
+        return collections
+
+    def record_insert(self, collection_name: str, count: int) -> None:
+        with self._lock:
+            self._delta(collection_name)["inserted"] += count
+        self.save()
+
+    def record_delete(self, collection_name: str, count: int) -> None:
+        with self._lock:
+            self._delta(collection_name)["deleted"] += count
+        self.save()
+
+    def record_use(self, collection_name: str) -> None:
+        with self._lock:
+            self._delta(collection_name)["last_used"] = time.time()
+            due = time.monotonic() - self._last_save >= USE_SAVE_INTERVAL
+
+        if due:
+            self.save()
+
+    def reset_inserted(self, collection_name: str) -> None:
+        with self._lock:
+            delta = self._delta(collection_name)
+            delta["inserted"] = 0
+            delta["reset_inserted"] = True
+        self.save()
+
+    def reset_deleted(self, collection_name: str) -> None:
+        with self._lock:
+            delta = self._delta(collection_name)
+            delta["deleted"] = 0
+            delta["reset_deleted"] = True
+        self.save()
+
+    def forget(self, collection_name: str) -> None:
+        with self._lock:
+            self._pending.pop(collection_name, None)
+            self._delta(collection_name)["forget"] = True
+        self.save()
+
+    def get(self, collection_name: str) -> dict:
+
+        '''
+        Statistics of a collection as a dictionary with the `inserted`, `deleted` and `last_used` keys, including the changes of this process that are not saved yet
+        '''
+
+        with self._lock:
+            collections = self._merge(CollectionStatistics._read())
+
+        return collections.get(collection_name, {"inserted": 0, "deleted": 0, "last_used": None})
+
+    def save(self) -> None:
+
+        '''
+        Merges the changes of this process into the statistics file
+        '''
+
+        stats_path = CollectionStatistics.stats_path()
+        temporary_path = stats_path.with_name(f"{stats_path.name}.{os.getpid()}.tmp")
+
+        with self._lock:
+            if not self._pending:
+                return
+
+            with open(stats_path.with_name(f"{stats_path.name}.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                collections = self._merge(CollectionStatistics._read())
+                with open(temporary_path, "wb") as b_file:
+                    pickle.dump(collections, b_file)
+                os.replace(temporary_path, stats_path)
+
+            self._pending.clear()
+            self._last_save = time.monotonic()
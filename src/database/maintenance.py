@@ -0,0 +1,271 @@
+import threading
+import contextlib
+
+from datetime import datetime
+from collections import Counter
+
+from settings.config import Config
+from utils.singleton import Singleton
+from utils.logger import LogManager
+from database.milvus_client import MilvusDBClient
+from database.client_pool import MilvusClientPool
+from database.collection_stats import CollectionStatistics
+
+logger = LogManager().get_logger("database")
+
+EMBEDDING_DIMENSIONS = 37
+BYTES_PER_ROW = EMBEDDING_DIMENSIONS * 4 + 64
+
+class CollectionMaintenance(metaclass=Singleton):
+
+    '''
+    Keeps the collections healthy as documents are inserted and deleted
+
+    * a collection is compacted once the rows deleted since its last compaction exceed `MAINTENANCE.COMPACTION_DELETED_RATIO` of its rows
+    * the index of a collection is rebuilt once the rows inserted since its last build exceed `MAINTENANCE.REINDEX_INSERT_RATIO` of its rows,
+      a collection whose rows were all inserted since its index was built, such as a freshly created one, is not reindexed
+    * collections are loaded on first use and the least recently searched collections of the database are released when the estimated memory
+      of the loaded collections would exceed `MAINTENANCE.MEMORY_BUDGET_MB`, the search times are taken from the `CollectionStatistics`
+      shared by all the processes, so collections loaded by other processes or when they were created are released as well
+    * a collection is pinned while it is searched, see `loaded`, pinned collections are never released and their index is rebuilt
+      only once they are unpinned, the pins only coordinate the threads of this process
+
+    Compaction and index rebuilds run after every ingestion and with the `maintenance --apply` command of the app
+    '''
+
+    def __init__(self) -> None:
+        maintenance_config = Config().get_instance()["MAINTENANCE"]
+        self._compaction_deleted_ratio = maintenance_config["COMPACTION_DELETED_RATIO"]
+        self._reindex_insert_ratio = maintenance_config["REINDEX_INSERT_RATIO"]
+        self._memory_budget = maintenance_config["MEMORY_BUDGET_MB"] * 2 ** 20
+        self._pins: Counter = Counter()
+        self._exclusive: set = set()
+        self._changing: set = set()
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
+
+    @staticmethod
+    def estimated_bytes(rows: int) -> int:
+        return rows * BYTES_PER_ROW
+
+    def ensure_loaded(self, db_client: MilvusDBClient) -> None:
+
+        '''
+        Loads the collection of `db_client` if it is not loaded yet, releasing the least recently searched collections of the database
+        to stay within the memory budget, the collection is expected to be pinned by the caller, see `loaded`
+
+        Parameters
+        ---------------------------------------------------
+        `db_client`: client bound to the collection to be loaded
+        '''
+
+        collection_name = db_client.collection_name
+
+        # a collection marked as changing is being loaded or released by another thread, its load state is checked again once it is done
+        if collection_name not in self._changing and db_client.is_loaded():
+            return
+
+        with self._condition:
+            self._condition.wait_for(lambda: collection_name not in self._changing)
+            self._changing.add(collection_name)
+
+        try:
+            if db_client.is_loaded():
+                return
+
+            required_bytes = CollectionMaintenance.estimated_bytes(db_client.count_records_in_collection())
+            self._release_until(db_client, self._memory_budget - required_bytes)
+            db_client.load_collection()
+        finally:
+            with self._condition:
+                self._changing.discard(collection_name)
+                self._condition.notify_all()
+
+    @staticmethod
+    def _loaded_collections(db_client: MilvusDBClient) -> list[tuple[str, int]]:
+
+        '''
+        Loaded collections of the database with their estimated memory, ordered from the least to the most recently searched,
+        collections that were never searched come first
+
+        Returns
+        ---------------------------------------------------
+        list of (collection name, estimated bytes)
+        '''
+
+        collection_statistics = CollectionStatistics()
+        loaded_collections = list()
+
+        for collection_name in db_client.list_all_collections():
+            try:
+                collection_client = db_client.use_collection(collection_name)
+                if collection_client.is_loaded():
+                    loaded_collections.append((collection_name, CollectionMaintenance.estimated_bytes(collection_client.count_records_in_collection())))
+            except Exception as e:
+                logger.error(f"Unable to get the load state of collection {collection_name} due to {e}")
+
+        return sorted(loaded_collections, key=lambda loaded_collection: collection_statistics.get(loaded_collection[0])["last_used"] or 0)
+
+    def _release_until(self, db_client: MilvusDBClient, budget_bytes: int) -> None:
+        loaded_collections = CollectionMaintenance._loaded_collections(db_client)
+        loaded_bytes = sum(collection_bytes for _, collection_bytes in loaded_collections)
+
+        for collection_name, collection_bytes in loaded_collections:
+            if loaded_bytes <= budget_bytes:
+                return
+
+            with self._condition:
+                if self._pins[collection_name] or collection_name in self._exclusive or collection_name in self._changing:
+                    continue
+                self._changing.add(collection_name)
+
+            try:
+                db_client.use_collection(collection_name).release_collection()
+                loaded_bytes -= collection_bytes
+            except Exception as e:
+                logger.error(f"Unable to release collection {collection_name} due to {e}")
+            finally:
+                with self._condition:
+                    self._changing.discard(collection_name)
+                    self._condition.notify_all()
+
+        if loaded_bytes > budget_bytes:
+            logger.warning("Loaded collections exceed the memory budget, the remaining collections are in use")
+
+    @contextlib.contextmanager
+    def loaded(self, *db_clients: MilvusDBClient):
+
+        '''
+        Loads the collections of `db_clients`, see `ensure_loaded`, and pins them for the duration of the context
+        so that they are neither released nor reindexed while they are searched
+
+        Parameters
+        ---------------------------------------------------
+        `db_clients`: clients bound to the collections to be searched
+
+        Returns
+        ---------------------------------------------------
+        context manager
+        '''
+
+        collection_names = [db_client.collection_name for db_client in db_clients]
+
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive.intersection(collection_names))
+            self._pins.update(collection_names)
+
+        try:
+            for db_client in db_clients:
+                self.ensure_loaded(db_client)
+            yield
+        finally:
+            with self._condition:
+                self._pins.subtract(collection_names)
+                self._pins += Counter()
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def _exclusive_use(self, collection_name: str):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._pins[collection_name] and collection_name not in self._exclusive)
+            self._exclusive.add(collection_name)
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive.discard(collection_name)
+                self._condition.notify_all()
+
+    def status(self, db_client: MilvusDBClient) -> dict:
+
+        '''
+        Maintenance status of the collection of `db_client`
+
+        Returns
+        ---------------------------------------------------
+        dictionary with the rows, the insert and delete volume since the last index build and compaction, their ratios to the rows,
+        the load state, the estimated memory, the time of the last search and the actions that are due
+        '''
+
+        collection_name = db_client.collection_name
+        statistics = CollectionStatistics().get(collection_name)
+        rows = db_client.count_records_in_collection()
+        deleted_ratio = statistics["deleted"] / rows if rows else 0.0
+        insert_ratio = statistics["inserted"] / rows if rows else 0.0
+
+        due = list()
+        if statistics["deleted"] and deleted_ratio >= self._compaction_deleted_ratio:
+            due.append("compact")
+        if statistics["inserted"] and rows > statistics["inserted"] and insert_ratio >= self._reindex_insert_ratio:
+            due.append("reindex")
+
+        return {
+            "collection": collection_name,
+            "rows": rows,
+            "inserted_since_index": statistics["inserted"],
+            "deleted_since_compaction": statistics["deleted"],
+            "insert_ratio": round(insert_ratio, 4),
+            "deleted_ratio": round(deleted_ratio, 4),
+            "loaded": db_client.is_loaded(),
+            "estimated_mb": round(CollectionMaintenance.estimated_bytes(rows) / 2 ** 20, 2),
+            "last_used": datetime.fromtimestamp(statistics["last_used"]).strftime("%Y-%m-%d %H:%M:%S") if statistics["last_used"] else None,
+            "due": ",".join(due),
+        }
+
+    def maintain(self, db_client: MilvusDBClient) -> list[str]:
+
+        '''
+        Compacts and rebuilds the index of the collection of `db_client` when they are due, failures are logged and skipped,
+        the index rebuild waits until the collection is no longer searched by this process
+
+        Returns
+        ---------------------------------------------------
+        list of the actions that were run
+        '''
+
+        due = self.status(db_client)["due"]
+        applied = list()
+
+        if "compact" in due:
+            try:
+                db_client.compact()
+                applied.append("compact")
+            except ValueError:
+                pass
+        if "reindex" in due:
+            try:
+                with self._exclusive_use(db_client.collection_name):
+                    db_client.rebuild_index()
+                applied.append("reindex")
+            except ValueError:
+                pass
+
+        return applied
+
+    def report(self, collection_names: (list[str] | None) = None, apply: bool = False) -> list[dict]:
+
+        '''
+        Maintenance status of the collections, optionally running the actions that are due
+
+        Parameters
+        ---------------------------------------------------
+        `collection_names`: collections to be checked, defaults to all the collections of the database
+        `apply`: compact and rebuild the indexes of the collections that are due
+
+        Returns
+        ---------------------------------------------------
+        list of the status of every collection, see `status`, with the actions that were run
+        '''
+
+        rows = list()
+
+        with MilvusClientPool().acquire() as db_client:
+            for collection_name in (collection_names or db_client.list_all_collections()):
+                collection_client = db_client.use_collection(collection_name)
+                status = self.status(collection_client)
+                status["applied"] = ",".join(self.maintain(collection_client)) if apply and status["due"] else ""
+                rows.append(status)
+
+        CollectionStatistics().save()
+        return rows
@@ -2,13 +2,14 @@ from enum import StrEnum
 
 from pymilvus import DataType, IndexType
 from pymilvus import db, MilvusClient, Collection, connections
+from pymilvus.client.types import LoadState
 from pymilvus.exceptions import MilvusException, DataNotMatchException
 
 from settings.config import Config
-from utils.singleton import Singleton
 from utils.logger import LogManager
+from database.collection_stats import CollectionStatistics
 
-logger = LogManager().get_logger()
+logger = LogManager().get_logger("database")
 
 class Metric(StrEnum):
     INNER_PRODUCT = "IP"
@@ -22,17 +23,26 @@ class Field(StrEnum):
     BOOK_NM = "book_nm"
     EMBEDDINGS = "embeddings"
 
-class MilvusDBClient(metaclass=Singleton):
+PAGE_COLLECTION_SUFFIX = "_pages"
+
+class MilvusDBClient:
 
     '''
-    Client to access MilvusDB
+    Client to access MilvusDB, every client is bound to a single collection
+
+    Parameters
+    ---------------------------------------------------
+    `collection_name`: collection the document operations are run on, defaults to `MILVUS.TEST_COLLECTION` of the config
+    `client`: connection to be used, a new connection is opened when not provided (see `database.client_pool.MilvusClientPool` for sharing connections)
     '''
 
-    def __init__(self) -> None:
+    def __init__(self, collection_name: (str | None) = None, client: (MilvusClient | None) = None) -> None:
         config_dict = Config().get_instance()
-        connections.connect(db_name=config_dict["MILVUS"]["DB"], host=config_dict["MILVUS"]["HOST"], port=config_dict["MILVUS"]["PORT"])
-        self._client = MilvusClient(uri=f"http://{config_dict['MILVUS']['HOST']}:{config_dict['MILVUS']['PORT']}", db_name=config_dict["MILVUS"]["DB"])
-        self._current_collection = config_dict["MILVUS"]["TEST_COLLECTION"]
+        if client is None:
+            connections.connect(db_name=config_dict["MILVUS"]["DB"], host=config_dict["MILVUS"]["HOST"], port=config_dict["MILVUS"]["PORT"])
+            client = MilvusClient(uri=f"http://{config_dict['MILVUS']['HOST']}:{config_dict['MILVUS']['PORT']}", db_name=config_dict["MILVUS"]["DB"])
+        self._client = client
+        self._collection_name = collection_name or config_dict["MILVUS"]["TEST_COLLECTION"]
 
     @staticmethod
     def create_database(db_name: str) -> None:
@@ -86,7 +96,7 @@ class MilvusDBClient(metaclass=Singleton):
     def create_collection(self, collection_name: str) -> None:
 
         '''
-        Utility for creating a collection 
+        Utility for creating a collection along with its page signature collection, see `create_page_collection`
         '''
 
         collection_schema = self._client.create_schema(
@@ -111,16 +121,64 @@ class MilvusDBClient(metaclass=Singleton):
         collection_schema.verify()
 
         self._client.create_collection(collection_name, schema=collection_schema, index_params=index_params)
-        self._current_collection = collection_name
+        self.create_page_collection(collection_name)
 
-    def use_collection(self, collection_name: str) -> None:
+    def create_page_collection(self, collection_name: str) -> None:
 
         '''
-        Utility for switching the current collection
+        Utility for creating the page signature collection that accompanies the collection `collection_name`, it stores one embedding per page,
+        nothing is done when it exists already
+        '''
+
+        if MilvusDBClient.page_collection_name(collection_name) in self.list_all_collections():
+            return
+
+        collection_schema = self._client.create_schema(
+            auto_id=True,
+            enable_dynamic_field=False,
+        )
+
+        index_params = self._client.prepare_index_params()
+        index_params.add_index(
+            field_name=Field.EMBEDDINGS.value,
+            index_name="embeddings_index",
+            index_type=IndexType.FLAT,
+            metric_type=Metric.INNER_PRODUCT.value
+        )
+
+        collection_schema.add_field(field_name=Field.ID.value, datatype=DataType.INT64, is_primary=True, auto_id=True)
+        collection_schema.add_field(field_name=Field.PAGE_NM.value, datatype=DataType.INT16)
+        collection_schema.add_field(field_name=Field.BOOK_NM.value, datatype=DataType.VARCHAR, max_length=300)
+        collection_schema.add_field(field_name=Field.EMBEDDINGS.value, datatype=DataType.FLOAT_VECTOR, dim=37)
+
+        collection_schema.verify()
+
+        self._client.create_collection(MilvusDBClient.page_collection_name(collection_name), schema=collection_schema, index_params=index_params)
+
+    @staticmethod
+    def page_collection_name(collection_name: str) -> str:
+        return f"{collection_name}{PAGE_COLLECTION_SUFFIX}"
+
+    @property
+    def collection_name(self) -> str:
+        return self._collection_name
+
+    def page_collection_client(self) -> "MilvusDBClient":
+
+        '''
+        Utility for getting a client bound to the page signature collection of the collection, the connection is shared
+        '''
+
+        return MilvusDBClient(MilvusDBClient.page_collection_name(self._collection_name), client=self._client)
+
+    def use_collection(self, collection_name: str) -> "MilvusDBClient":
+
+        '''
+        Utility for getting a client bound to another collection, the connection is shared and this client stays bound to its collection
         '''
 
         if collection_name in self.list_all_collections():
-            self._current_collection = collection_name
+            return MilvusDBClient(collection_name, client=self._client)
 
         else:
             logger.error(f"Collection '{collection_name}' does not exist and cannot be switched")
@@ -137,6 +195,7 @@ class MilvusDBClient(metaclass=Singleton):
         except (MilvusException, Exception) as e:
             logger.error(f"Unable to delete collection {collection_name}")
             raise ValueError(f"Unable to delete collection {collection_name}")
+        CollectionStatistics().forget(collection_name)
 
     def list_all_collections(self) -> list[str]:
 
@@ -152,8 +211,8 @@ class MilvusDBClient(metaclass=Singleton):
         Utility for loading the collection in memory
         '''
 
-        self._client.load_collection(collection_name=self._current_collection)
-        logger.info(f"Collection {self._current_collection} loaded")
+        self._client.load_collection(collection_name=self._collection_name)
+        logger.info(f"Collection {self._collection_name} loaded")
 
     def release_collection(self) -> None:
 
@@ -161,8 +220,63 @@ class MilvusDBClient(metaclass=Singleton):
         Utility for releasing the collection in memory
         '''
 
-        self._client.release_collection(collection_name=self._current_collection)
-        logger.info(f"Collection {self._current_collection} released")
+        self._client.release_collection(collection_name=self._collection_name)
+        logger.info(f"Collection {self._collection_name} released")
+
+    def is_loaded(self) -> bool:
+
+        '''
+        Utility for checking whether the collection is loaded in memory
+        '''
+
+        return self._client.get_load_state(collection_name=self._collection_name)["state"] == LoadState.Loaded
+
+    def compact(self, timeout: (float | None) = None) -> None:
+
+        '''
+        Utility for compacting the segments of the collection, the space of the deleted documents is reclaimed
+
+        Parameters
+        ---------------------------------------------------
+        `timeout`: seconds to wait for the compaction to complete, waits indefinitely by default
+        '''
+
+        try:
+            collection = Collection(name=self._collection_name, using=self._client._using)
+            collection.compact()
+            collection.wait_for_compaction_completed(timeout=timeout)
+        except (MilvusException, Exception) as e:
+            logger.error(f"Unable to compact collection {self._collection_name} due to {e}")
+            raise ValueError(f"Unable to compact collection {self._collection_name}")
+        CollectionStatistics().reset_deleted(self._collection_name)
+        logger.info(f"Collection {self._collection_name} compacted")
+
+    def rebuild_index(self) -> None:
+
+        '''
+        Utility for dropping and creating again the indexes of the collection with their current parameters,
+        a loaded collection is released during the rebuild and loaded again afterwards
+        '''
+
+        try:
+            collection = Collection(name=self._collection_name, using=self._client._using)
+            indexes = [(index.field_name, index.index_name, dict(index.params)) for index in collection.indexes]
+            loaded = self.is_loaded()
+            if loaded:
+                collection.release()
+            for field_name, index_name, index_params in indexes:
+                index_type = index_params.pop("index_type")
+                metric_type = index_params.pop("metric_type")
+                index_params.pop("dim", None)
+                collection.drop_index(index_name=index_name)
+                collection.create_index(field_name, {"index_type": index_type, "metric_type": metric_type, "params": index_params.pop("params", index_params)}, index_name=index_name)
+            if loaded:
+                collection.load()
+        except (MilvusException, Exception) as e:
+            logger.error(f"Unable to rebuild the index of collection {self._collection_name} due to {e}")
+            raise ValueError(f"Unable to rebuild the index of collection {self._collection_name}")
+        CollectionStatistics().reset_inserted(self._collection_name)
+        logger.info(f"Index of collection {self._collection_name} rebuilt")
 
     def count_records_in_collection(self) -> int:
 
@@ -170,12 +284,12 @@ class MilvusDBClient(metaclass=Singleton):
         Utility for counting the number of records in the collection
         '''
 
-        return Collection(name=self._current_collection).num_entities
+        return Collection(name=self._collection_name, using=self._client._using).num_entities
 
     def insert(self, document: dict | list[dict]) -> dict:
 
         '''
-        Utility for single and bulk insert of documents in the current collection
+        Utility for single and bulk insert of documents in the collection
 
         Parameters
         ---------------------------------------------------
@@ -187,9 +301,39 @@ class MilvusDBClient(metaclass=Singleton):
         '''
 
         try:
-            return self._client.insert(self._current_collection, document)
+            result = self._client.insert(self._collection_name, document)
+            CollectionStatistics().record_insert(self._collection_name, result["insert_count"])
+            return result
+        except DataNotMatchException as e:
+            logger.error(f"Input Document or list of documents does not match the fields in the collection {self._collection_name}")
+            raise ValueError(f"Error occured in insertion of documents due to {e}")
+        except (MilvusException, Exception) as e:
+            logger.error(f"Error occured in insertion of documents due to {e}")
+            raise ValueError(f"Error occured in insertion of documents due to {e}")
+
+    def insert_columns(self, tokens: list[str], page_nms: list[int], book_nms: list[str], embeddings: list[list[float]]) -> int:
+
+        '''
+        Utility for column based bulk insert of documents in the collection, this avoids building a dictionary per document for large batches
+
+        Parameters
+        ---------------------------------------------------
+        `tokens`: values of the token field
+        `page_nms`: values of the page number field
+        `book_nms`: values of the book name field
+        `embeddings`: values of the embeddings field, a list of vectors or a 2d float32 numpy array
+
+        Returns
+        ---------------------------------------------------
+        number of documents inserted
+        '''
+
+        try:
+            insert_count = Collection(name=self._collection_name, using=self._client._using).insert([tokens, page_nms, book_nms, embeddings]).insert_count
+            CollectionStatistics().record_insert(self._collection_name, insert_count)
+            return insert_count
         except DataNotMatchException as e:
-            logger.error(f"Input Document or list of documents does not match the fields in the collection {self._current_collection}")
+            logger.error(f"Input columns do not match the fields in the collection {self._collection_name}")
             raise ValueError(f"Error occured in insertion of documents due to {e}")
         except (MilvusException, Exception) as e:
             logger.error(f"Error occured in insertion of documents due to {e}")
@@ -198,7 +342,7 @@ class MilvusDBClient(metaclass=Singleton):
     def delete(self, ids: list[int], filter: (str | None) = None) -> dict:
 
         '''
-        Utility for single and bulk deletion of documents in the current collection
+        Utility for single and bulk deletion of documents in the collection
 
         Parameters
         ---------------------------------------------------
@@ -211,7 +355,9 @@ class MilvusDBClient(metaclass=Singleton):
         '''
 
         try:
-            return self._client.delete(self._current_collection, ids=ids, filter=filter)
+            result = self._client.delete(self._collection_name, ids=ids, filter=filter)
+            CollectionStatistics().record_delete(self._collection_name, len(result) if isinstance(result, list) else result["delete_count"])
+            return result
         except (MilvusException, Exception) as e:
             logger.error(f"Error occurred in deletion of documents due to {e}")
             raise ValueError(f"Error occurred in deletion of documents due to {e.message}")
@@ -219,7 +365,7 @@ class MilvusDBClient(metaclass=Singleton):
     def search(self, embeddings: (list[list[float]]), filter: str="", output_fields: list[Field]=[Field.TOKEN, Field.PAGE_NM, Field.BOOK_NM],limit: int = 10, offset: int = 0, metric_type:Metric = Metric.INNER_PRODUCT, other_search_params: dict = {}):
 
         '''
-        Utility for single and bulk search of documents in the current collection (this type of search only supports single vector fields)
+        Utility for single and bulk search of documents in the collection (this type of search only supports single vector fields)
         For multiple vector fields hybrid search must be implemented
 
         Parameters
@@ -260,7 +406,8 @@ class MilvusDBClient(metaclass=Singleton):
         output_field_values = [field.value for field in output_fields]
 
         try:
-            return self._client.search(self._current_collection, data=embeddings, output_fields=output_field_values, filter=filter, limit=limit, offset=offset, search_params={"metric_type": metric_type.value, "params": other_search_params})
+            CollectionStatistics().record_use(self._collection_name)
+            return self._client.search(self._collection_name, data=embeddings, output_fields=output_field_values, filter=filter, limit=limit, offset=offset, search_params={"metric_type": metric_type.value, "params": other_search_params})
         except (MilvusException, Exception) as e:
             logger.error(f"Unable to query for the given vector due to {e}")
             raise ValueError(f"Unable to query for the given vector due to {e}")
@@ -291,7 +438,7 @@ class MilvusDBClient(metaclass=Singleton):
         output_field_values = [field.value for field in output_fields]
 
         try:
-            return list(self._client.query(self._current_collection, ids=ids, filter=filter, output_fields=output_field_values))
+            return list(self._client.query(self._collection_name, ids=ids, filter=filter, output_fields=output_field_values))
         except (ValueError, MilvusException, Exception) as e:
             logger.error(f"Unable to query for the given vector due to {e}")
             raise ValueError(f"Unable to query for the given vector due to {e}")
\ No newline at end of file
@@ -1,11 +1,18 @@
 from tqdm import tqdm
+from collections import Counter
 
+from settings.config import Config
 from datagen.parse_pdf import PDF
 from utils.logger import LogManager
+from utils.profiler import Profiler
+from datagen.snapshot import export_snapshot
+from datagen.token_stats import TokenStatistics
+from datagen.dedup import page_deduplicator, repeated_lines, strip_lines
 from database.milvus_client import Field
 from utils.normalize_token import normalize_all
-from database.milvus_client import MilvusDBClient
-from embeddings.unigram_embeddings import vectorize
+from database.client_pool import MilvusClientPool
+from database.maintenance import CollectionMaintenance
+from embeddings.unigram_embeddings import vectorize, aggregate
 
 CHUNK_SIZE = 1000
 
@@ -13,32 +20,122 @@ def chunkify(iterable, chunk_size=CHUNK_SIZE):
     for i in range(0, len(iterable), chunk_size):
         yield iterable[i:i + chunk_size]
 
-def run(files: list[tuple]):
-    db_client = MilvusDBClient()
-    logger = LogManager().get_logger()
+def run(files: list[tuple], collection_name: (str | None) = None) -> dict:
+
+    '''
+    Parses, vectorizes and stores the pages of the given PDF files
+
+    With `DEDUP.ENABLED` the repeated header and footer lines of every book are stripped and pages whose normalized token stream
+    was already stored are recorded as aliases of the stored page instead of being vectorized and inserted again
+
+    Parameters
+    ---------------------------------------------------
+    `files`: list of (input file name, output file name, page start, page end)
+    `collection_name`: collection to be loaded, defaults to `MILVUS.TEST_COLLECTION` of the config
+
+    Returns
+    ---------------------------------------------------
+    dictionary with the number of pages, duplicate pages, stored rows, skipped rows and stripped lines
+    '''
+
+    token_statistics = TokenStatistics()
+    dedup_config = Config().get_instance()["DEDUP"]
+    logger = LogManager().get_logger("datagen")
     logger.info(f"running datagen for {len(files)} files")
 
-    for _tuple in files:
-        input_file_path, output_file_path, page_start, page_end = _tuple
-
-        pdf_instance = PDF(input_file_path, output_file_path, page_start, page_end)
-        pdf_instance.convert_pdf_to_text()
-        pdf_instance.store_page_offset()
-        vectorized_lines = list()
-
-        for page_nm, page in tqdm(enumerate(pdf_instance.paginate()), desc=f"Iterating file: {pdf_instance.output_file_path.name}"):
-            for line in page:
-                normalized_tokens = normalize_all(line).split("_")
-                for token in normalized_tokens:
-                    vector = vectorize(token)
-                    if vector is None:
-                        continue
-                    vectorized_lines.append({
-                        Field.TOKEN: token,
-                        Field.PAGE_NM: page_nm,
-                        Field.BOOK_NM: pdf_instance.file_name,
-                        Field.EMBEDDINGS: vector,
-                    })
-
-        for lines_chunk in tqdm(chunkify(vectorized_lines), desc="Storing documents in MilvusDB"):
-            db_client.insert(lines_chunk)
+    profiler = Profiler()
+    summary = Counter()
+
+    with profiler.stage("datagen.run"), MilvusClientPool().acquire(collection_name) as db_client:
+        deduplicator = page_deduplicator(db_client.collection_name) if dedup_config["ENABLED"] else None
+
+        for _tuple in files:
+            input_file_path, output_file_path, page_start, page_end = _tuple
+
+            with profiler.stage("datagen.convert"):
+                pdf_instance = PDF(input_file_path, output_file_path, page_start, page_end)
+                pdf_instance.convert_pdf_to_text()
+                pdf_instance.store_page_offset()
+                pdf_instance.store_page_index()
+            vectorized_lines = list()
+            page_signatures = list()
+            page_tokens = list()
+            book_summary = Counter()
+
+            with profiler.stage("datagen.vectorize"):
+                pages = [[normalize_all(line) for line in page] for page in pdf_instance.paginate()]
+                repeated = set()
+                if deduplicator is not None:
+                    deduplicator.begin_book(pdf_instance.file_name)
+                    repeated = repeated_lines(pages, dedup_config["HEADER_FOOTER_LINES"], dedup_config["HEADER_FOOTER_RATIO"])
+
+                for page_nm, lines in tqdm(enumerate(pages), desc=f"Iterating file: {pdf_instance.output_file_path.name}"):
+                    stripped_lines = strip_lines(lines, repeated, dedup_config["HEADER_FOOTER_LINES"])
+                    tokens = [token for line in stripped_lines for token in line.split("_") if token]
+                    book_summary["pages"] += 1
+                    book_summary["stripped_lines"] += len(lines) - len(stripped_lines)
+
+                    stored_tokens = set()
+                    if deduplicator is not None and tokens:
+                        duplicate = deduplicator.register(pdf_instance.file_name, page_nm, tokens, dedup_config["NEAR_DUPLICATES"])
+                        if duplicate is not None:
+                            _, stored_tokens = duplicate
+                            book_summary["duplicate_pages"] += 1
+
+                    page_vectors = list()
+                    for token in tokens:
+                        if token in stored_tokens:
+                            book_summary["skipped_rows"] += 1
+                            continue
+                        try:
+                            vector = vectorize(token)
+                        except ValueError:
+                            continue
+                        vectorized_lines.append({
+                            Field.TOKEN: token,
+                            Field.PAGE_NM: page_nm,
+                            Field.BOOK_NM: pdf_instance.file_name,
+                            Field.EMBEDDINGS: vector,
+                        })
+                        page_vectors.append(vector)
+
+                    page_tokens.append(tokens)
+
+                    signature = aggregate(page_vectors)
+                    if signature is not None:
+                        page_signatures.append({
+                            Field.PAGE_NM: page_nm,
+                            Field.BOOK_NM: pdf_instance.file_name,
+                            Field.EMBEDDINGS: signature,
+                        })
+
+            book_summary["rows"] = len(vectorized_lines)
+            logger.info(
+                f"{pdf_instance.file_name}: {book_summary['duplicate_pages']} of {book_summary['pages']} pages duplicate, "
+                f"{book_summary['skipped_rows']} rows skipped, {book_summary['stripped_lines']} header and footer lines stripped"
+            )
+            summary.update(book_summary)
+
+            with profiler.stage("datagen.snapshot"):
+                dedup_record = deduplicator.export_book(pdf_instance.file_name) if deduplicator is not None else None
+                export_snapshot(pdf_instance.file_name, vectorized_lines, page_tokens, dedup_record)
+                token_statistics.update_book(pdf_instance.file_name, page_tokens)
+
+            with profiler.stage("datagen.insert"):
+                for lines_chunk in tqdm(chunkify(vectorized_lines), desc="Storing documents in MilvusDB"):
+                    db_client.insert(lines_chunk)
+
+                db_client.create_page_collection(db_client.collection_name)
+                page_db_client = db_client.page_collection_client()
+                for signatures_chunk in tqdm(chunkify(page_signatures), desc="Storing page signatures in MilvusDB"):
+                    page_db_client.insert(signatures_chunk)
+
+            token_statistics.save()
+            if deduplicator is not None:
+                deduplicator.save()
+
+        collection_maintenance = CollectionMaintenance()
+        collection_maintenance.maintain(db_client)
+        collection_maintenance.maintain(db_client.page_collection_client())
+
+    return dict(summary)
@@ -0,0 +1,361 @@
+import math
+import pickle
+import hashlib
+import pathlib
+import numpy as np
+
+from re import sub
+from collections import Counter
+from functools import lru_cache
+
+from settings.config import Config
+from utils.logger import LogManager
+
+logger = LogManager().get_logger("datagen")
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+RANDOM_SEED = 7
+
+def line_key(normalized_line: str) -> str:
+
+    '''
+    Key of a normalized line used to detect repeated headers and footers, digits are masked so that running page numbers compare equal
+    '''
+
+    return sub(r"\d+", "#", normalized_line)
+
+def repeated_lines(pages: list[list[str]], edge_lines: int, min_ratio: float) -> set[str]:
+
+    '''
+    Finds the header and footer lines of a book, that is the lines found among the first or last `edge_lines` non empty lines
+    of at least `min_ratio` of the pages
+
+    Parameters
+    ---------------------------------------------------
+    `pages`: normalized lines of every page of the book
+    `edge_lines`: number of lines at the top and at the bottom of a page that are considered
+    `min_ratio`: fraction of the pages a line must be repeated on
+
+    Returns
+    ---------------------------------------------------
+    set of line keys, see `line_key`
+    '''
+
+    if edge_lines <= 0:
+        return set()
+
+    edge_counter = Counter()
+    for lines in pages:
+        lines = [line for line in lines if line]
+        edge_counter.update({line_key(line) for line in lines[:edge_lines] + lines[-edge_lines:]})
+
+    min_pages = max(2, math.ceil(min_ratio * len(pages)))
+    return {key for key, count in edge_counter.items() if count >= min_pages}
+
+def strip_lines(lines: list[str], repeated: set[str], edge_lines: int) -> list[str]:
+
+    '''
+    Removes the repeated header and footer lines found among the first or last `edge_lines` non empty lines of a page
+    '''
+
+    if not repeated:
+        return lines
+
+    non_empty = [idx for idx, line in enumerate(lines) if line]
+    edges = set(non_empty[:edge_lines] + non_empty[-edge_lines:])
+
+    return [line for idx, line in enumerate(lines) if idx not in edges or line_key(line) not in repeated]
+
+def fingerprint(tokens: list[str]) -> str:
+
+    '''
+    Exact fingerprint of the normalized token stream of a page
+    '''
+
+    return hashlib.blake2b("_".join(tokens).encode("utf-8"), digest_size=16).hexdigest()
+
+class MinHash:
+
+    '''
+    MinHash signatures of the token shingles of a page, the fraction of equal signature values estimates the jaccard similarity of two pages
+    '''
+
+    def __init__(self, permutations: int, shingle_size: int) -> None:
+        generator = np.random.default_rng(RANDOM_SEED)
+        self._a = generator.integers(1, 1 << 31, size=permutations, dtype=np.uint64)
+        self._b = generator.integers(0, 1 << 31, size=permutations, dtype=np.uint64)
+        self._shingle_size = shingle_size
+
+    def signature(self, tokens: list[str]) -> np.ndarray:
+        shingles = {"_".join(tokens[i:i + self._shingle_size]) for i in range(max(1, len(tokens) - self._shingle_size + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = ((np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME) & MAX_HASH
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def similarity(signature: np.ndarray, other_signature: np.ndarray) -> float:
+        return float(np.mean(signature == other_signature))
+
+class PageDeduplicator:
+
+    '''
+    Index of the fingerprints of the stored pages, a page whose token stream was already stored is recorded as an alias
+    of the stored (canonical) page instead of being vectorized and inserted again
+
+    Near duplicates are found with MinHash signatures bucketed by bands when `DEDUP.NEAR_DUPLICATES` is enabled, only the tokens
+    a near duplicate page does not share with its canonical page are stored for it, the tokens of the canonical page it does not contain
+    are recorded with the alias so that they are not attributed to it at search time
+
+    The index is kept per collection, and per book so that ingesting a book again replaces its previous contribution
+    '''
+
+    def __init__(self, collection_name: str) -> None:
+        dedup_config = Config().get_instance()["DEDUP"]
+        self._minhash = MinHash(dedup_config["MINHASH_PERMUTATIONS"], dedup_config["SHINGLE_SIZE"])
+        self._bands = dedup_config["MINHASH_BANDS"]
+        self._collection_name = collection_name
+        self._books: dict = dict()
+        self._exact: dict = dict()
+        self._buckets: dict = dict()
+        self._aliases: dict = dict()
+        self._canonical: dict = dict()
+
+        index_path = PageDeduplicator.index_path(collection_name)
+        if index_path.exists():
+            with open(index_path, "rb") as b_file:
+                self._books = pickle.load(b_file)
+        self._rebuild()
+
+    @staticmethod
+    def index_path(collection_name: str) -> pathlib.Path:
+        return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["PICKLE_DIR"]), pathlib.Path(f"{collection_name}_page_fingerprints.pkl"))
+
+    def _band_keys(self, signature: np.ndarray) -> list:
+        rows = len(signature) // self._bands
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self._bands)]
+
+    def _index_page(self, book_name: str, page_nm: int) -> None:
+        book = self._books[book_name]
+        key = (book_name, page_nm)
+        self._exact[book["fingerprints"][page_nm]] = key
+        if page_nm in book["signatures"]:
+            for band_key in self._band_keys(book["signatures"][page_nm]):
+                if band_key not in self._buckets:
+                    self._buckets[band_key] = list()
+                self._buckets[band_key].append(key)
+
+    def _rebuild(self) -> None:
+        self._exact.clear()
+        self._buckets.clear()
+        self._aliases.clear()
+        self._canonical.clear()
+
+        for book_name, book in self._books.items():
+            for page_nm in book["fingerprints"]:
+                self._index_page(book_name, page_nm)
+            for page_nm in book["aliases"]:
+                self._add_alias(book_name, page_nm)
+
+    def begin_book(self, book_name: str) -> None:
+
+        '''
+        Drops the pages previously recorded for a book before it is ingested again
+        '''
+
+        if book_name in self._books:
+            del self._books[book_name]
+            self._rebuild()
+
+        self._books[book_name] = {"fingerprints": dict(), "signatures": dict(), "tokens": dict(), "aliases": dict()}
+
+    def register(self, book_name: str, page_nm: int, tokens: list[str], near_duplicates: bool = False) -> (tuple | None):
+
+        '''
+        Records a page of the book being ingested
+
+        Parameters
+        ---------------------------------------------------
+        `book_name`: name of the book as stored in the collection
+        `page_nm`: page number of the page in the book
+        `tokens`: normalized token stream of the page
+        `near_duplicates`: also look for near duplicate pages using the MinHash signatures
+
+        Returns
+        ---------------------------------------------------
+        None when the page is new and has to be stored,
+        otherwise (canonical page as (book name, page number), set of the tokens already stored for the canonical page)
+        '''
+
+        book = self._books[book_name]
+        page_fingerprint = fingerprint(tokens)
+
+        if page_fingerprint in self._exact:
+            book["aliases"][page_nm] = (self._exact[page_fingerprint], frozenset())
+            self._add_alias(book_name, page_nm)
+            return self._exact[page_fingerprint], set(tokens)
+
+        signature = self._minhash.signature(tokens) if near_duplicates else None
+
+        if signature is not None:
+            best_key, best_similarity = None, 0.0
+            for band_key in self._band_keys(signature):
+                for candidate_key in self._buckets.get(band_key, []):
+                    similarity = MinHash.similarity(signature, self._books[candidate_key[0]]["signatures"][candidate_key[1]])
+                    if similarity > best_similarity:
+                        best_key, best_similarity = candidate_key, similarity
+
+            if best_key is not None and best_similarity >= Config().get_instance()["DEDUP"]["NEAR_DUPLICATE_THRESHOLD"]:
+                canonical_tokens = self._books[best_key[0]]["tokens"][best_key[1]]
+                book["aliases"][page_nm] = (best_key, canonical_tokens.difference(tokens))
+                self._add_alias(book_name, page_nm)
+                return best_key, canonical_tokens
+
+        book["fingerprints"][page_nm] = page_fingerprint
+        if signature is not None:
+            book["signatures"][page_nm] = signature
+            book["tokens"][page_nm] = frozenset(tokens)
+        self._index_page(book_name, page_nm)
+
+        return None
+
+    def _add_alias(self, book_name: str, page_nm: int) -> None:
+        canonical_key, excluded_tokens = self._books[book_name]["aliases"][page_nm]
+        if canonical_key not in self._aliases:
+            self._aliases[canonical_key] = list()
+        self._aliases[canonical_key].append(((book_name, page_nm), excluded_tokens))
+        self._canonical[(book_name, page_nm)] = canonical_key
+
+    def save(self) -> None:
+
+        '''
+        Persists the fingerprints and aliases of all the books
+        '''
+
+        with open(PageDeduplicator.index_path(self._collection_name), "wb") as b_file:
+            pickle.dump(self._books, b_file)
+        logger.info(f"page fingerprints of collection {self._collection_name} saved for {len(self._books)} books and {sum(len(book['aliases']) for book in self._books.values())} aliased pages")
+
+    def export_book(self, book_name: str) -> (dict | None):
+
+        '''
+        Fingerprints and aliases of a book along with the fingerprints of the canonical pages of its aliases, see `restore_book`
+
+        Returns
+        ---------------------------------------------------
+        dictionary with the `fingerprints`, `signatures`, `tokens`, `aliases` and `canonical_fingerprints` of the pages, None when the book is not recorded
+        '''
+
+        if book_name not in self._books:
+            return None
+
+        book = self._books[book_name]
+        canonical_fingerprints = dict()
+        for page_nm, (canonical_key, _) in book["aliases"].items():
+            canonical_book = self._books.get(canonical_key[0])
+            if canonical_book is not None and canonical_key[1] in canonical_book["fingerprints"]:
+                canonical_fingerprints[page_nm] = canonical_book["fingerprints"][canonical_key[1]]
+
+        return {**{field: dict(values) for field, values in book.items()}, "canonical_fingerprints": canonical_fingerprints}
+
+    def restore_book(self, book_name: str, exported_book: dict) -> list[int]:
+
+        '''
+        Records a book exported with `export_book` from another collection, replacing its previous contribution,
+        an alias is kept only when its canonical page is recorded in this collection with the same fingerprint
+
+        Returns
+        ---------------------------------------------------
+        page numbers of the aliases that were not kept, these pages are not stored in this collection and have to be registered and stored again
+        '''
+
+        self.begin_book(book_name)
+        book = self._books[book_name]
+        book["fingerprints"].update(exported_book["fingerprints"])
+        book["signatures"].update(exported_book["signatures"])
+        book["tokens"].update(exported_book["tokens"])
+
+        unresolved_pages = list()
+        for page_nm, (canonical_key, excluded_tokens) in exported_book["aliases"].items():
+            canonical_book = self._books.get(canonical_key[0])
+            canonical_fingerprint = exported_book["canonical_fingerprints"].get(page_nm)
+            if canonical_book is not None and canonical_fingerprint is not None and canonical_book["fingerprints"].get(canonical_key[1]) == canonical_fingerprint:
+                book["aliases"][page_nm] = (canonical_key, excluded_tokens)
+            else:
+                unresolved_pages.append(page_nm)
+
+        self._rebuild()
+        return sorted(unresolved_pages)
+
+    def clear(self) -> None:
+
+        '''
+        Drops the fingerprints and aliases of all the books, used when the rows of the collection are dropped
+        '''
+
+        self._books.clear()
+        self._rebuild()
+        PageDeduplicator.index_path(self._collection_name).unlink(missing_ok=True)
+
+    def stored_pages(self, pages: set) -> set:
+
+        '''
+        Adds the canonical pages of the aliased pages, that is the pages whose documents are searched to match the given pages
+
+        Parameters
+        ---------------------------------------------------
+        `pages`: set of (book name, page number)
+
+        Returns
+        ---------------------------------------------------
+        set of (book name, page number)
+        '''
+
+        if not self._canonical:
+            return pages
+
+        return pages.union(self._canonical[key] for key in pages if key in self._canonical)
+
+    def expand(self, hits: dict) -> dict:
+
+        '''
+        Adds the aliases of the matched pages to the hits of a token
+
+        Parameters
+        ---------------------------------------------------
+        `hits`: dictionary of (book name, page number) to the set of matched tokens
+
+        Returns
+        ---------------------------------------------------
+        dictionary of (book name, page number) to the set of matched tokens, including the aliased pages
+        '''
+
+        if not self._aliases:
+            return hits
+
+        expanded_hits = dict(hits)
+        for key, matched_tokens in hits.items():
+            for alias_key, excluded_tokens in self._aliases.get(key, []):
+                alias_tokens = matched_tokens.difference(excluded_tokens)
+                if not alias_tokens:
+                    continue
+                if alias_key not in expanded_hits:
+                    expanded_hits[alias_key] = set()
+                else:
+                    expanded_hits[alias_key] = set(expanded_hits[alias_key])
+                expanded_hits[alias_key].update(alias_tokens)
+
+        return expanded_hits
+
+@lru_cache(maxsize=None)
+def page_deduplicator(collection_name: str) -> PageDeduplicator:
+
+    '''
+    Shared `PageDeduplicator` of a collection
+    '''
+
+    return PageDeduplicator(collection_name)
@@ -3,27 +3,31 @@ import os
 from settings.config import Config
 from utils.logger import LogManager
 from database.milvus_client import MilvusDBClient
+from database.client_pool import MilvusClientPool
+from datagen.dedup import page_deduplicator
 
 Config(os.environ.get("CONFIG_FILE_PATH"))
 LogManager("test")
 config_dict = Config().get_instance()
 
 def reset_database():
-    db_client = MilvusDBClient()
-    db_client.delete_database(config_dict["MILVUS"]["DB"])
+    MilvusClientPool()
+    MilvusDBClient.delete_database(config_dict["MILVUS"]["DB"])
 
 def reset_collection():
-    db_client = MilvusDBClient()
-    db_client.delete_collection(config_dict["MILVUS"]["TEST_COLLECTION"])
+    with MilvusClientPool().acquire() as db_client:
+        db_client.delete_collection(config_dict["MILVUS"]["TEST_COLLECTION"])
+        db_client.delete_collection(db_client.page_collection_name(config_dict["MILVUS"]["TEST_COLLECTION"]))
+    page_deduplicator(config_dict["MILVUS"]["TEST_COLLECTION"]).clear()
 
 def init_database():
-    db_client = MilvusDBClient()
-    print(db_client.list_all_databases())
-    db_client.create_database(config_dict["MILVUS"]["DB"])
-    print(db_client.list_all_databases())
+    MilvusClientPool()
+    print(MilvusDBClient.list_all_databases())
+    MilvusDBClient.create_database(config_dict["MILVUS"]["DB"])
+    print(MilvusDBClient.list_all_databases())
 
 def init_collection():
-    db_client = MilvusDBClient()
-    print(db_client.list_all_collections())
-    db_client.create_collection(config_dict["MILVUS"]["TEST_COLLECTION"])
-    print(db_client.list_all_collections())
\ No newline at end of file
+    with MilvusClientPool().acquire() as db_client:
+        print(db_client.list_all_collections())
+        db_client.create_collection(config_dict["MILVUS"]["TEST_COLLECTION"])
+        print(db_client.list_all_collections())
\ No newline at end of file
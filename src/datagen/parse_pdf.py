@@ -31,7 +31,7 @@ class PDF:
         self.file_name = input_file_path.stem
 
     def convert_pdf_to_text(self):
-        logger = LogManager().get_logger()
+        logger = LogManager().get_logger("datagen")
         
         logger.info(f"file: {self.input_file_path.name} to text conversion started")
         if self.page_start == 0 and self.page_end == 0:
@@ -56,6 +56,31 @@ class PDF:
 
         file.close()
 
+    def store_page_index(self):
+
+        '''
+        Records the byte offset and length of every page in the output text file, so that any page can be read back without scanning the file from the top
+        '''
+
+        page_index = list()
+        page_break = PDF.PAGE_BREAK.encode()
+        page_start = 0
+        offset = 0
+
+        with open(self.output_file_path, "rb") as file:
+            for line in file:
+                if line.strip() == page_break:
+                    page_index.append((page_start, offset - page_start))
+                    page_start = offset + len(line)
+                offset += len(line)
+
+        with open(PDF.page_index_path(self.file_name), "wb") as b_file:
+            pickle.dump((str(self.output_file_path), page_index), b_file)
+
+    @staticmethod
+    def page_index_path(book_name: str) -> pathlib.Path:
+        return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["PICKLE_DIR"]), pathlib.Path(f"{book_name}_page_index.pkl"))
+
     def store_page_offset(self):
         pdf_details = (self.input_file_path.stem, self.page_start, self.page_end)
         pickle.dump(pdf_details, open(pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["OUTPUT_DIR"]), pathlib.Path(f"./pickle_files/{self.input_file_path.stem}.pkl")), "wb"))
\ No newline at end of file
@@ -0,0 +1,217 @@
+import json
+import pickle
+import pathlib
+import numpy as np
+
+from tqdm import tqdm
+
+from settings.config import Config
+from utils.logger import LogManager
+from database.milvus_client import Field
+from database.client_pool import MilvusClientPool
+from database.maintenance import CollectionMaintenance
+from embeddings.unigram_embeddings import vectorize, aggregate
+from datagen.token_stats import TokenStatistics
+from datagen.dedup import page_deduplicator
+
+logger = LogManager().get_logger("datagen")
+
+EMBEDDINGS_FILE = "embeddings.npy"
+COLUMNS_FILE = "columns.npz"
+META_FILE = "meta.json"
+PAGES_FILE = "pages.pkl"
+LOAD_BATCH_SIZE = 2000
+
+def snapshot_path(book_name: str) -> pathlib.Path:
+    return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["SNAPSHOT_DIR"]), pathlib.Path(book_name))
+
+def export_snapshot(book_name: str, documents: list[dict], page_tokens: (list[list[str]] | None) = None, dedup_record: (dict | None) = None) -> pathlib.Path:
+
+    '''
+    Writes the vectorized documents of a book to disk so that collections can be rebuilt without parsing the PDF again
+
+    The snapshot directory contains
+        * `embeddings.npy`: float32 matrix of shape (documents, dimensions), can be memory mapped
+        * `columns.npz`: utf-8 bytes of all the tokens with their offsets, int16 page numbers and the book name
+        * `meta.json`: number of documents and dimensions
+        * `pages.pkl`: tokens of every page and the fingerprints and aliases of the book, the documents of duplicate pages are not part of the snapshot
+
+    Parameters
+    ---------------------------------------------------
+    `book_name`: name of the book as stored in the collection
+    `documents`: list of dictionary containing data corresponding to the fields of the collection schema
+    `page_tokens`: normalized tokens of every page of the book
+    `dedup_record`: fingerprints and aliases of the book, see `PageDeduplicator.export_book`
+
+    Returns
+    ---------------------------------------------------
+    path of the snapshot directory
+    '''
+
+    directory = snapshot_path(book_name)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    embeddings = np.asarray([document[Field.EMBEDDINGS] for document in documents], dtype=np.float32)
+    encoded_tokens = [document[Field.TOKEN].encode("utf-8") for document in documents]
+    token_offsets = np.zeros(len(encoded_tokens) + 1, dtype=np.int64)
+    np.cumsum([len(token) for token in encoded_tokens], out=token_offsets[1:])
+
+    np.save(pathlib.Path.joinpath(directory, EMBEDDINGS_FILE), embeddings)
+    np.savez(
+        pathlib.Path.joinpath(directory, COLUMNS_FILE),
+        token_bytes=np.frombuffer(b"".join(encoded_tokens), dtype=np.uint8),
+        token_offsets=token_offsets,
+        page_nm=np.asarray([document[Field.PAGE_NM] for document in documents], dtype=np.int16),
+        book_nm=np.asarray([book_name]),
+    )
+    with open(pathlib.Path.joinpath(directory, META_FILE), "w") as file:
+        json.dump({"documents": len(documents), "dimensions": int(embeddings.shape[1]) if len(documents) else 0}, file)
+    with open(pathlib.Path.joinpath(directory, PAGES_FILE), "wb") as b_file:
+        pickle.dump({"page_tokens": page_tokens, "dedup": dedup_record}, b_file)
+
+    logger.info(f"snapshot of {len(documents)} documents written for book {book_name}")
+    return directory
+
+def iterate_snapshot(book_name: str, batch_size: int = LOAD_BATCH_SIZE):
+
+    '''
+    Reads a snapshot in column batches, embeddings are memory mapped so only the current batch is read from disk
+    and they are handed out as float32 array slices without converting them to python lists
+
+    Parameters
+    ---------------------------------------------------
+    `book_name`: name of the book as stored in the collection
+    `batch_size`: number of documents per batch
+
+    Returns
+    ---------------------------------------------------
+    generator of (tokens, page numbers, book names, embeddings array) column batches
+    '''
+
+    directory = snapshot_path(book_name)
+
+    if not directory.exists():
+        logger.error(f"Snapshot for book '{book_name}' does not exist")
+        raise ValueError(f"Snapshot for book '{book_name}' does not exist")
+
+    with open(pathlib.Path.joinpath(directory, META_FILE), "r") as file:
+        documents = json.load(file)["documents"]
+
+    if documents == 0:
+        return
+
+    embeddings = np.load(pathlib.Path.joinpath(directory, EMBEDDINGS_FILE), mmap_mode="r")
+    with np.load(pathlib.Path.joinpath(directory, COLUMNS_FILE)) as columns:
+        token_bytes = columns["token_bytes"].tobytes()
+        token_offsets = columns["token_offsets"]
+        page_nms = columns["page_nm"]
+        stored_book_name = str(columns["book_nm"][0])
+
+    for start in range(0, documents, batch_size):
+        end = min(start + batch_size, documents)
+        tokens = [token_bytes[token_offsets[i]:token_offsets[i + 1]].decode("utf-8") for i in range(start, end)]
+        yield tokens, page_nms[start:end].tolist(), [stored_book_name] * (end - start), embeddings[start:end]
+
+def _page_vectors(book_name: str) -> dict:
+    directory = snapshot_path(book_name)
+    embeddings = np.load(pathlib.Path.joinpath(directory, EMBEDDINGS_FILE), mmap_mode="r")
+    with np.load(pathlib.Path.joinpath(directory, COLUMNS_FILE)) as columns:
+        page_nms = columns["page_nm"]
+
+    return {int(page_nm): embeddings[page_nms == page_nm] for page_nm in np.unique(page_nms)}
+
+def _read_pages(book_name: str) -> dict:
+    pages_path = pathlib.Path.joinpath(snapshot_path(book_name), PAGES_FILE)
+    if not pages_path.exists():
+        return {"page_tokens": None, "dedup": None}
+
+    with open(pages_path, "rb") as b_file:
+        return pickle.load(b_file)
+
+def load_snapshot(book_name: str, collection_name: (str | None) = None, batch_size: int = LOAD_BATCH_SIZE) -> int:
+
+    '''
+    Bulk loads the snapshot of a book into a collection, the page signatures are recomputed from the snapshot
+
+    The fingerprints and aliases of the book are restored into the page deduplicator of the collection, a duplicate page whose canonical page
+    is not stored in the collection, for instance a page of another book, is vectorized and stored again from the page tokens of the snapshot.
+    Snapshots written without the page tokens only update the token statistics of books that are not recorded already,
+    since they do not contain the duplicate pages
+
+    Parameters
+    ---------------------------------------------------
+    `book_name`: name of the book as stored in the collection
+    `collection_name`: collection to be loaded, defaults to `MILVUS.TEST_COLLECTION` of the config
+    `batch_size`: number of documents per insert request
+
+    Returns
+    ---------------------------------------------------
+    number of documents inserted
+    '''
+
+    inserted = 0
+    page_tokens = dict()
+    page_vectors = dict()
+    page_signatures = list()
+    pages = _read_pages(book_name)
+
+    with MilvusClientPool().acquire(collection_name) as db_client:
+        for tokens, page_nms, book_nms, embeddings in tqdm(iterate_snapshot(book_name, batch_size), desc=f"Loading snapshot: {book_name}"):
+            inserted += db_client.insert_columns(tokens, page_nms, book_nms, embeddings)
+            for token, page_nm in zip(tokens, page_nms):
+                if page_nm not in page_tokens:
+                    page_tokens[page_nm] = list()
+                page_tokens[page_nm].append(token)
+
+        if inserted:
+            page_vectors = {page_nm: list(vectors) for page_nm, vectors in _page_vectors(book_name).items()}
+
+        if pages["dedup"] is not None:
+            deduplicator = page_deduplicator(db_client.collection_name)
+            near_duplicates = Config().get_instance()["DEDUP"]["NEAR_DUPLICATES"]
+            restored_documents = list()
+
+            for page_nm in deduplicator.restore_book(book_name, pages["dedup"]):
+                tokens = pages["page_tokens"][page_nm]
+                duplicate = deduplicator.register(book_name, page_nm, tokens, near_duplicates)
+                stored_tokens = set(page_tokens.get(page_nm, [])).union(duplicate[1] if duplicate is not None else [])
+                for token in tokens:
+                    if token in stored_tokens:
+                        continue
+                    try:
+                        vector = vectorize(token)
+                    except ValueError:
+                        continue
+                    restored_documents.append({Field.TOKEN: token, Field.PAGE_NM: page_nm, Field.BOOK_NM: book_name, Field.EMBEDDINGS: vector})
+                    if page_nm not in page_vectors:
+                        page_vectors[page_nm] = list()
+                    page_vectors[page_nm].append(vector)
+
+            for start in range(0, len(restored_documents), batch_size):
+                inserted += db_client.insert(restored_documents[start:start + batch_size])["insert_count"]
+            deduplicator.save()
+
+        for page_nm, vectors in page_vectors.items():
+            signature = aggregate(vectors)
+            if signature is not None:
+                page_signatures.append({Field.PAGE_NM: page_nm, Field.BOOK_NM: book_name, Field.EMBEDDINGS: signature})
+
+        db_client.create_page_collection(db_client.collection_name)
+        page_db_client = db_client.page_collection_client()
+        for start in range(0, len(page_signatures), batch_size):
+            page_db_client.insert(page_signatures[start:start + batch_size])
+
+        collection_maintenance = CollectionMaintenance()
+        collection_maintenance.maintain(db_client)
+        collection_maintenance.maintain(page_db_client)
+
+    token_statistics = TokenStatistics()
+    if pages["page_tokens"] is not None:
+        token_statistics.update_book(book_name, pages["page_tokens"])
+        token_statistics.save()
+    elif not token_statistics.has_book(book_name):
+        token_statistics.update_book(book_name, list(page_tokens.values()))
+        token_statistics.save()
+
+    logger.info(f"{inserted} documents loaded from snapshot of book {book_name}")
+    return inserted
@@ -0,0 +1,99 @@
+import math
+import pickle
+import pathlib
+
+from collections import Counter
+
+from settings.config import Config
+from utils.singleton import Singleton
+from utils.logger import LogManager
+
+logger = LogManager().get_logger("datagen")
+
+class TokenStatistics(metaclass=Singleton):
+
+    '''
+    Document frequency (number of pages containing a token) and collection frequency (number of occurrences of a token) of the normalized tokens of the corpus,
+    the statistics are kept per book so that ingesting a book again replaces its previous contribution
+    '''
+
+    def __init__(self) -> None:
+        self._books: dict = dict()
+        self.documents = 0
+        self.document_frequency: Counter = Counter()
+        self.collection_frequency: Counter = Counter()
+
+        stats_path = TokenStatistics.stats_path()
+        if stats_path.exists():
+            with open(stats_path, "rb") as b_file:
+                self._books = pickle.load(b_file)
+            for pages, document_frequency, collection_frequency in self._books.values():
+                self._add(pages, document_frequency, collection_frequency)
+
+    @staticmethod
+    def stats_path() -> pathlib.Path:
+        return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["PICKLE_DIR"]), pathlib.Path("token_stats.pkl"))
+
+    def _add(self, pages: int, document_frequency: Counter, collection_frequency: Counter) -> None:
+        self.documents += pages
+        self.document_frequency.update(document_frequency)
+        self.collection_frequency.update(collection_frequency)
+
+    def _remove(self, pages: int, document_frequency: Counter, collection_frequency: Counter) -> None:
+        self.documents -= pages
+        self.document_frequency.subtract(document_frequency)
+        self.collection_frequency.subtract(collection_frequency)
+        self.document_frequency = +self.document_frequency
+        self.collection_frequency = +self.collection_frequency
+
+    def has_book(self, book_name: str) -> bool:
+        return book_name in self._books
+
+    def update_book(self, book_name: str, page_tokens: list[list[str]]) -> None:
+
+        '''
+        Replaces the statistics of a book
+
+        Parameters
+        ---------------------------------------------------
+        `book_name`: name of the book as stored in the collection
+        `page_tokens`: normalized tokens of every page of the book
+        '''
+
+        if book_name in self._books:
+            self._remove(*self._books[book_name])
+
+        document_frequency = Counter()
+        collection_frequency = Counter()
+        for tokens in page_tokens:
+            document_frequency.update(set(tokens))
+            collection_frequency.update(tokens)
+
+        self._books[book_name] = (len(page_tokens), document_frequency, collection_frequency)
+        self._add(*self._books[book_name])
+
+    def save(self) -> None:
+
+        '''
+        Persists the statistics of all the books
+        '''
+
+        with open(TokenStatistics.stats_path(), "wb") as b_file:
+            pickle.dump(self._books, b_file)
+        logger.info(f"token statistics saved for {len(self._books)} books and {self.documents} pages")
+
+    def document_ratio(self, token: str) -> float:
+
+        '''
+        Fraction of the pages of the corpus that contain the `token`
+        '''
+
+        return self.document_frequency[token] / self.documents if self.documents else 0.0
+
+    def idf(self, token: str) -> float:
+
+        '''
+        Smoothed inverse document frequency of the `token`
+        '''
+
+        return math.log((self.documents + 1) / (self.document_frequency[token] + 1)) + 1
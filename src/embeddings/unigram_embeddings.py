@@ -5,7 +5,7 @@ from settings.config import Config
 from utils.normalize_token import normalize_all, remove_stop_words
 from utils.logger import LogManager
 
-logger = LogManager().get_logger()
+logger = LogManager().get_logger("embeddings")
 UNIGRAMS_DICT: dict = dict()
 VALID_CHARACTERS = "0123456789abcdefghijklmnopqrstuvwxyz_"
 
@@ -66,7 +66,7 @@ def _unigram_vectorize(normalized_token: str) -> (np.ndarray | None):
 
             weight -= 8
         except (AttributeError, Exception) as e:
-            logger.error(f"Invalid token: {normalized_token} {str(e)}")
+            LogManager().aggregate("invalid_token", normalized_token)
             return None
 
     return normalized_vector
@@ -96,11 +96,35 @@ def vectorize(token: str) -> (list | None):
             result = np.linalg.norm(token_vector, ord=2)
             vector_magnitude = result if result > 0 else 1
         except (RuntimeWarning, RuntimeError, Exception) as e:
-            logger.error(f"{token} cannot be vectorized due to {e}")
+            LogManager().aggregate("vectorization_error", f"{token} ({e})")
             raise ValueError("Vectorization Error")
     
     normalized_vector = [(mag/vector_magnitude) for mag in token_vector]
     
     return normalized_vector
 
+def aggregate(vectors: list[list]) -> (list | None):
+    '''
+    Combines the vectors of the tokens of a page into a single signature vector, the signature is the normalized sum of the distinct vectors
+
+    Parameters
+    ---------------------------------------------------
+    `vectors`: normalized token vectors
+
+    Returns
+    ---------------------------------------------------
+    list | None: signature vector, None when there are no vectors to combine
+    '''
+
+    if len(vectors) == 0:
+        return None
+
+    signature = np.unique(np.asarray(vectors, dtype=np.float64), axis=0).sum(axis=0)
+    magnitude = np.linalg.norm(signature, ord=2)
+
+    if magnitude == 0:
+        return None
+
+    return (signature / magnitude).tolist()
+
 init()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import math
+import pickle
+import pathlib
+import numpy as np
+
+from settings.config import Config
+from utils.singleton import Singleton
+from utils.logger import LogManager
+from datagen.token_stats import TokenStatistics
+from embeddings.unigram_embeddings import vectorize
+
+logger = LogManager().get_logger("fetch")
+
+LENGTH_BUCKETS = [(1, 1), (2, 2), (3, 3), (4, 4), (5, 6), (7, 8), (9, 12), (13, None)]
+REPETITIVE_RATIO = 0.75
+RADIUS_STEP = 0.01
+MAX_RADIUS = 0.99
+SAMPLES_PER_BUCKET = 200
+RANDOM_SEED = 7
+
+def length_bucket(token: str) -> str:
+    for low, high in LENGTH_BUCKETS:
+        if high is None:
+            return f"{low}+"
+        if low <= len(token) <= high:
+            return f"{low}" if low == high else f"{low}-{high}"
+
+def profile(token: str) -> tuple[str, bool]:
+
+    '''
+    Profile of a token used to look up its calibration, the length bucket and whether the token repeats many of its characters
+    '''
+
+    return length_bucket(token), len(set(token)) / max(len(token), 1) < REPETITIVE_RATIO
+
+def calibration_path() -> pathlib.Path:
+    return pathlib.Path.joinpath(pathlib.Path(Config().get_instance()["PICKLE_DIR"]), pathlib.Path("radius_calibration.pkl"))
+
+def radius_grid(min_radius: float) -> list[float]:
+    return [round(float(radius), 2) for radius in np.arange(min_radius, MAX_RADIUS + RADIUS_STEP / 2, RADIUS_STEP)]
+
+def build_calibration(min_radius: float, target_results: (int | None) = None, page_limit: int = 1000, max_results: int = 16000) -> dict:
+
+    '''
+    Builds the radius calibration table from the ingested vocabulary and persists it, for every token profile the smallest radius from `min_radius`
+    upwards is chosen whose expected number of results stays within `target_results`, the expected number of results is estimated from the similarity
+    of sampled vocabulary tokens of the profile to every vocabulary token weighted by its collection frequency, so the calibration only ever tightens the radius
+
+    Parameters
+    ---------------------------------------------------
+    `min_radius`: smallest radius of a profile, the radius of the search parameters
+    `target_results`: expected number of results per token, defaults to `SEARCH.CALIBRATION_TARGET_RESULTS` of the config
+    `page_limit`: number of results per search request, the result limit of a profile is a multiple of it
+    `max_results`: upper bound of the result limit of a profile
+
+    Returns
+    ---------------------------------------------------
+    dictionary of profile to the radius, result limit and the expected number of results
+    '''
+
+    target_results = target_results or Config().get_instance()["SEARCH"]["CALIBRATION_TARGET_RESULTS"]
+    token_statistics = TokenStatistics()
+    vocabulary = list()
+    vectors = list()
+
+    for token in token_statistics.collection_frequency:
+        try:
+            vectors.append(vectorize(token))
+            vocabulary.append(token)
+        except ValueError:
+            continue
+
+    if not vocabulary:
+        logger.error("Cannot build radius calibration without token statistics")
+        raise ValueError("Cannot build radius calibration without token statistics")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    frequencies = np.asarray([token_statistics.collection_frequency[token] for token in vocabulary], dtype=np.float64)
+    profiles = dict()
+    for idx, token in enumerate(vocabulary):
+        key = profile(token)
+        if key not in profiles:
+            profiles[key] = list()
+        profiles[key].append(idx)
+
+    random_generator = np.random.default_rng(RANDOM_SEED)
+    calibration = dict()
+
+    for key, indices in profiles.items():
+        samples = random_generator.choice(indices, size=min(SAMPLES_PER_BUCKET, len(indices)), replace=False)
+        similarities = vectors @ vectors[samples].T
+        selected = None
+
+        for radius in radius_grid(min_radius):
+            counts = frequencies @ (similarities > radius)
+            selected = (radius, counts)
+            if counts.mean() <= target_results:
+                break
+
+        radius, counts = selected
+        limit = int(min(max_results, max(page_limit, math.ceil(np.percentile(counts, 95) / page_limit) * page_limit)))
+        calibration[key] = {"radius": radius, "limit": limit, "expected_results": round(float(counts.mean()), 1)}
+
+    with open(calibration_path(), "wb") as b_file:
+        pickle.dump(calibration, b_file)
+
+    logger.info(f"radius calibration built for {len(calibration)} token profiles from {len(vocabulary)} tokens")
+    RadiusCalibration().reload()
+    return calibration
+
+class RadiusCalibration(metaclass=Singleton):
+
+    '''
+    Looks up the calibrated similarity radius and result limit of a token, tokens without a calibration use the `default_radius` and `default_limit`
+    and a calibrated radius below the `default_radius` is raised to it
+    '''
+
+    def __init__(self) -> None:
+        self.reload()
+
+    def reload(self) -> None:
+        self._calibration: dict = dict()
+        if calibration_path().exists():
+            with open(calibration_path(), "rb") as b_file:
+                self._calibration = pickle.load(b_file)
+
+    def lookup(self, token: str, default_radius: float, default_limit: int) -> tuple[float, int]:
+
+        '''
+        Returns the similarity radius and the maximum number of results for the `token`
+        '''
+
+        enabled = Config().get_instance()["SEARCH"]["ADAPTIVE_RADIUS"]
+        calibration = self._calibration.get(profile(token)) if enabled else None
+
+        if calibration is None:
+            return default_radius, default_limit
+
+        return max(calibration["radius"], default_radius), min(calibration["limit"], default_limit)
+
+    def table(self) -> dict:
+        return dict(self._calibration)
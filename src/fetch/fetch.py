@@ -1,63 +1,504 @@
+import sys
+import json
+import heapq
 import pickle
+import asyncio
+
+from enum import StrEnum
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from itertools import islice
+from functools import lru_cache
+from typing import Iterable, TextIO
 
 from settings.config import Config
+from utils.logger import LogManager
 from database.milvus_client import Field
 from utils.normalize_token import normalize_all
+from utils.profiler import Profiler
 from database.milvus_client import MilvusDBClient
+from database.client_pool import MilvusClientPool
+from database.maintenance import CollectionMaintenance
 from embeddings.unigram_embeddings import vectorize
+from fetch.page_reader import PageReader
+from fetch.calibration import RadiusCalibration
+from datagen.token_stats import TokenStatistics
+from datagen.dedup import page_deduplicator
 
 # REMOVE_ME
 import pandas as pd
 from pprint import pprint
 from tabulate import tabulate
 
-def search(query: str):
-    db_client = MilvusDBClient()
-    normalized_query = normalize_all(query)
-    query_vectors = [vectorize(token) for token in normalized_query.split("_")]
+logger = LogManager().get_logger("fetch")
+
+PAGE_LIMIT = 1000
+MAX_RESULTS = 16000
+SEARCH_PARAMS = {"radius": 0.9, "range_filter": 1.001}
+VECTORS_PER_REQUEST = 16
+BULK_CHUNK_SIZE = 1000
+
+class QueryMode(StrEnum):
+    UNION = "union"
+    CONJUNCTIVE = "and"
+
+def _search_vectors(db_client: MilvusDBClient, query_vectors: list[list[float]], filter: str = "", max_results: (list[int] | None) = None, radii: (list[float] | None) = None) -> list[dict]:
+
+    '''
+    Runs the paginated similarity search for several vectors at once, each request carries up to `VECTORS_PER_REQUEST` vectors
+    sharing the same radius, a page requests up to `PAGE_LIMIT` results and vectors whose results are exhausted
+    or that reached their `max_results` are dropped from the following pages
+
+    Parameters
+    ---------------------------------------------------
+    `db_client`: client of the collection to be searched
+    `query_vectors`: embeddings of the query tokens
+    `filter`: filter clause restricting the documents to be searched
+    `max_results`: maximum number of results fetched for every vector, defaults to `MAX_RESULTS`
+    `radii`: similarity radius of every vector, defaults to the radius of `SEARCH_PARAMS`
+
+    Returns
+    ---------------------------------------------------
+    for every vector, dictionary of (book name, page number) to the set of matched tokens
+    '''
+
+    hits = [dict() for _ in query_vectors]
+    max_results = max_results or [MAX_RESULTS] * len(query_vectors)
+    radii = radii or [SEARCH_PARAMS["radius"]] * len(query_vectors)
+    radius_groups = dict()
+
+    for idx, radius in enumerate(radii):
+        if radius not in radius_groups:
+            radius_groups[radius] = list()
+        radius_groups[radius].append(idx)
+
+    for radius, group in radius_groups.items():
+        for batch_start in range(0, len(group), VECTORS_PER_REQUEST):
+            pending = group[batch_start:batch_start + VECTORS_PER_REQUEST]
+            offset = 0
+
+            while pending := [idx for idx in pending if offset < max_results[idx]]:
+                limit = min(PAGE_LIMIT, max(max_results[idx] for idx in pending) - offset)
+                results = db_client.search(
+                    embeddings=[query_vectors[idx] for idx in pending],
+                    filter=filter,
+                    output_fields=[Field.TOKEN, Field.PAGE_NM, Field.BOOK_NM],
+                    limit=limit,
+                    offset=offset,
+                    other_search_params={**SEARCH_PARAMS, "radius": radius}
+                )
+                exhausted = set()
+                for idx, vector_results in zip(pending, results):
+                    for result in vector_results[:max_results[idx] - offset]:
+                        key = (result["entity"]["book_nm"], result["entity"]["page_nm"])
+                        if key not in hits[idx]:
+                            hits[idx][key] = set()
+                        hits[idx][key].add(result["entity"]["token"])
+                    if len(vector_results) < limit:
+                        exhausted.add(idx)
+                pending = [idx for idx in pending if idx not in exhausted]
+                offset += limit
+
+    return hits
+
+def _shortlist_pages(db_client: MilvusDBClient, query_vectors: list[list[float]], shortlist_size: int) -> set:
+
+    '''
+    Searches the page signature collection for the pages closest to each of the query vectors
+
+    Returns
+    ---------------------------------------------------
+    set of (book name, page number) of the shortlisted pages
+    '''
+
+    results = db_client.page_collection_client().search(
+        embeddings=query_vectors,
+        output_fields=[Field.PAGE_NM, Field.BOOK_NM],
+        limit=shortlist_size
+    )
+
+    return {(result["entity"]["book_nm"], result["entity"]["page_nm"]) for vector_results in results for result in vector_results}
+
+def _page_filter(pages: set) -> str:
+
+    '''
+    Builds a filter clause that matches only the documents of the given (book name, page number) pairs
+    '''
+
+    book_pages = dict()
+    for book_name, page_nm in pages:
+        if book_name not in book_pages:
+            book_pages[book_name] = list()
+        book_pages[book_name].append(int(page_nm))
+
+    clauses = list()
+    for book_name, page_nms in book_pages.items():
+        escaped_book_name = book_name.replace("\\", "\\\\").replace('"', '\\"')
+        clauses.append(f'({Field.BOOK_NM.value} == "{escaped_book_name}" and {Field.PAGE_NM.value} in {sorted(page_nms)})')
+
+    return " or ".join(clauses)
+
+def _plan_tokens(tokens: list[str]) -> list[tuple[str, int, float]]:
+
+    '''
+    Orders the query tokens from the most to the least selective using the corpus token statistics,
+    tokens present in more than `SEARCH.MAX_DF_RATIO` of the pages are skipped unless every token is,
+    tokens present in more than `SEARCH.FREQUENT_DF_RATIO` of the pages are capped at `SEARCH.FREQUENT_TOKEN_LIMIT` results,
+    the similarity radius and result limit of every token are taken from the radius calibration of its length and character profile
+
+    Returns
+    ---------------------------------------------------
+    list of (token, maximum number of results, similarity radius)
+    '''
+
+    search_config = Config().get_instance()["SEARCH"]
+    token_statistics = TokenStatistics()
+    radius_calibration = RadiusCalibration()
+    ordered_tokens = sorted(dict.fromkeys(token for token in tokens if token), key=token_statistics.document_ratio)
+    planned_tokens = [token for token in ordered_tokens if token_statistics.document_ratio(token) <= search_config["MAX_DF_RATIO"]] or ordered_tokens[:1]
+
+    plan = list()
+    for token in planned_tokens:
+        max_results = search_config["FREQUENT_TOKEN_LIMIT"] if token_statistics.document_ratio(token) > search_config["FREQUENT_DF_RATIO"] else MAX_RESULTS
+        radius, max_results = radius_calibration.lookup(token, SEARCH_PARAMS["radius"], max_results)
+        plan.append((token, max_results, radius))
+
+    return plan
+
+def _rank_pages(token_hits: list[tuple[str, dict]]) -> list[tuple]:
+
+    '''
+    Merges the hits of the query tokens, every page is scored with the sum of the inverse document frequencies of the query tokens that matched it,
+    the hits are expected to be expanded to the duplicate pages already, see `PageDeduplicator.expand`
+
+    Returns
+    ---------------------------------------------------
+    list of ((book name, page number), score, matched tokens) ordered by descending score
+    '''
+
+    token_statistics = TokenStatistics()
     results_dict = dict()
+
+    for token, hits in token_hits:
+        idf = token_statistics.idf(token)
+        for key, matched_tokens in hits.items():
+            if key not in results_dict:
+                results_dict[key] = [0.0, set()]
+            results_dict[key][0] += idf
+            results_dict[key][1].update(matched_tokens)
+
+    return sorted(((key, score, matched_tokens) for key, (score, matched_tokens) in results_dict.items()), key=lambda result: result[1], reverse=True)
+
+def _conjunctive_search(db_client: MilvusDBClient, planned_tokens: list[tuple[str, int, float]], query_vectors: list[list[float]], minimum_should_match: int, filter: str = "") -> list[tuple[str, dict]]:
+
+    '''
+    Searches for the pages matched by at least `minimum_should_match` of the planned tokens, the tokens are searched from the most selective
+    and the pages that can still reach `minimum_should_match` are pushed down as a filter into the search of the next token.
+    Any qualifying page must match one of the first `len(planned_tokens) - minimum_should_match + 1` tokens, so only those are searched without a page filter
+
+    The hits are expanded to the duplicate pages before the matches are counted, a near duplicate page matches the tokens of its own documents
+    and the tokens it shares with its canonical page, and the filter of a duplicate page covers the documents of its canonical page
+
+    If no page qualifies, falls back to the union of all the tokens
+
+    Returns
+    ---------------------------------------------------
+    list of (token, dictionary of (book name, page number) to the set of matched tokens) expanded to the duplicate pages
+    '''
+
+    deduplicator = page_deduplicator(db_client.collection_name)
+    max_filter_pages = Config().get_instance()["SEARCH"]["MAX_FILTER_PAGES"]
+    tokens = [token for token, _, _ in planned_tokens]
+    max_results = [max_results for _, max_results, _ in planned_tokens]
+    radii = [radius for _, _, radius in planned_tokens]
+    minimum_should_match = min(max(1, minimum_should_match), len(tokens))
+    seed_count = len(tokens) - minimum_should_match + 1
+
+    seed_hits = _search_vectors(db_client, query_vectors[:seed_count], filter, max_results[:seed_count], radii[:seed_count])
+    token_hits = [(token, deduplicator.expand(hits)) for token, hits in zip(tokens[:seed_count], seed_hits)]
+    match_counts = Counter(key for _, hits in token_hits for key in hits)
+    candidates = set(match_counts)
+
+    for idx in range(seed_count, len(tokens)):
+        candidates = {key for key in candidates if match_counts[key] + len(tokens) - idx >= minimum_should_match}
+        if not candidates:
+            break
+
+        candidate_filter = _page_filter(deduplicator.stored_pages(candidates)) if len(candidates) <= max_filter_pages else filter
+        hits = deduplicator.expand(_search_vectors(db_client, [query_vectors[idx]], candidate_filter, [max_results[idx]], [radii[idx]])[0])
+        hits = {key: matched_tokens for key, matched_tokens in hits.items() if key in candidates}
+        token_hits.append((tokens[idx], hits))
+        match_counts.update(hits.keys())
+
+    matched_pages = {key for key in candidates if match_counts[key] >= minimum_should_match}
+
+    if not matched_pages:
+        remaining_hits = _search_vectors(db_client, query_vectors[seed_count:], filter, max_results[seed_count:], radii[seed_count:])
+        return token_hits[:seed_count] + [(token, deduplicator.expand(hits)) for token, hits in zip(tokens[seed_count:], remaining_hits)]
+
+    return [(token, {key: matched_tokens for key, matched_tokens in hits.items() if key in matched_pages}) for token, hits in token_hits]
+
+@lru_cache(maxsize=None)
+def _page_start(book_name: str) -> int:
+    pickle_dir = Config().get_instance()["PICKLE_DIR"]
+    with open(f"{pickle_dir}/{book_name}.pkl", "rb") as b_file:
+        _, page_start, page_end = pickle.load(b_file)
+    return int(page_start)
+
+def _format_results(ranked_pages: list[tuple], limit: (int | None) = None, snippets: int = 0) -> list[dict]:
     results_list = list()
-    config_instance = Config().get_instance()
-
-    for query_vector in query_vectors:
-        offset = 0
-        limit = 1000
-        while offset + limit <= 16000:
-            results = db_client.search(
-                embeddings=[query_vector],
-                output_fields=[Field.TOKEN, Field.PAGE_NM, Field.BOOK_NM],
-                limit=limit,
-                offset=offset,
-                other_search_params={"radius": 0.9, "range_filter": 1.0}
-            )
-            for result in results[0]:
-                '''
-                d = {
-                    "book_name": result["entity"]["book_nm"],
-                    "page_number": result["entity"]["page_nm"],
-                    "token": result["entity"]["token"],
-                    "distance": result["distance"],
-                }
-                '''
-                book_name = result["entity"]["book_nm"]
-                page_number = result["entity"]["page_nm"]
-                token = result["entity"]["token"]
-                distance = result["distance"]
-                if (book_name, page_number) not in results_dict:
-                    results_dict[(book_name, page_number)] = set()
-                results_dict[(book_name, page_number)].add(token)
-            offset += limit
-
-    for key, value in results_dict.items():
+
+    for idx, (key, score, value) in enumerate(islice(ranked_pages, limit)):
         b_name, page_nm = key
-        token = ",".join(value)
-        pickle_dir = config_instance["PICKLE_DIR"]
-        _, page_start, page_end = pickle.load(open(f"{pickle_dir}/{b_name}.pkl", "rb"))
-        results_list.append({
+        result = {
             "book_name": b_name,
-            "page_number": int(page_start) + int(page_nm),
-            "token": token
-        })
+            "page_number": _page_start(b_name) + int(page_nm),
+            "token": ",".join(value),
+            "score": round(score, 4)
+        }
+        if idx < snippets:
+            result["snippet"] = PageReader().get_snippet(b_name, int(page_nm), list(value))
+        results_list.append(result)
+
+    return results_list
+
+def _search_pages(db_client: MilvusDBClient, query: str, two_stage: (bool | None), mode: QueryMode, minimum_should_match: (int | None)) -> list[tuple]:
+
+    '''
+    Searches the collection of `db_client` for the `query`, see `search` for the parameters
+
+    Returns
+    ---------------------------------------------------
+    list of ((book name, page number), score, matched tokens) ordered by descending score
+    '''
+
+    profiler = Profiler()
 
-    dataframe = pd.DataFrame.from_dict(results_list[:10])
+    with profiler.stage("fetch.plan"):
+        normalized_query = normalize_all(query)
+        planned_tokens = _plan_tokens(normalized_query.split("_"))
+        query_vectors = [vectorize(token) for token, _, _ in planned_tokens]
+    search_config = Config().get_instance()["SEARCH"]
+    two_stage = search_config["TWO_STAGE"] if two_stage is None else two_stage
+    filter = ""
+    deduplicator = page_deduplicator(db_client.collection_name)
+
+    if not isinstance(mode, QueryMode):
+        raise ValueError("Must provide a mode of instance 'QueryMode'")
+
+    searched_clients = [db_client, db_client.page_collection_client()] if two_stage and query_vectors else [db_client]
+
+    with CollectionMaintenance().loaded(*searched_clients):
+        if two_stage and query_vectors:
+            with profiler.stage("fetch.shortlist"):
+                shortlisted_pages = _shortlist_pages(db_client, query_vectors, search_config["PAGE_SHORTLIST"])
+            if not shortlisted_pages:
+                return []
+            filter = _page_filter(deduplicator.stored_pages(shortlisted_pages))
+
+        with profiler.stage("fetch.vector_search"):
+            if mode == QueryMode.CONJUNCTIVE and len(planned_tokens) > 1:
+                token_hits = _conjunctive_search(db_client, planned_tokens, query_vectors, minimum_should_match or len(planned_tokens), filter)
+            else:
+                hits = _search_vectors(db_client, query_vectors, filter, [max_results for _, max_results, _ in planned_tokens], [radius for _, _, radius in planned_tokens])
+                token_hits = [(token, deduplicator.expand(token_hits)) for (token, _, _), token_hits in zip(planned_tokens, hits)]
+
+    with profiler.stage("fetch.rank"):
+        return _rank_pages(token_hits)
+
+def search(query: str, snippets: bool = False, top_k: int = 10, two_stage: (bool | None) = None, mode: QueryMode = QueryMode.UNION, minimum_should_match: (int | None) = None, collection_name: (str | None) = None) -> list[dict]:
+
+    '''
+    Searches the collection for pages containing tokens similar to the tokens of the `query`,
+    pages are ranked by the inverse document frequencies of the query tokens they match
+
+    Parameters
+    ---------------------------------------------------
+    `query`: input query
+    `snippets`: include a highlighted snippet of the page text for the top `top_k` pages
+    `top_k`: number of pages to be displayed
+    `two_stage`: shortlist candidate pages using the page signatures before searching the tokens, defaults to `SEARCH.TWO_STAGE` of the config
+    `mode`: `UNION` returns the pages matched by any token, `CONJUNCTIVE` returns the pages matched by at least `minimum_should_match` tokens
+    `minimum_should_match`: number of tokens a page must match in `CONJUNCTIVE` mode, defaults to all the tokens
+    `collection_name`: collection to be searched, defaults to `MILVUS.TEST_COLLECTION` of the config
+
+    Returns
+    ---------------------------------------------------
+    list of matched pages with the matched tokens
+    '''
+
+    profiler = Profiler()
+
+    with profiler.stage("fetch.search"), MilvusClientPool().acquire(collection_name) as db_client:
+        ranked_pages = _search_pages(db_client, query, two_stage, mode, minimum_should_match)
+
+    with profiler.stage("fetch.format"):
+        results_list = _format_results(ranked_pages, snippets=top_k if snippets else 0)
+
+    dataframe = pd.DataFrame.from_dict(results_list[:top_k])
     print(tabulate(dataframe, headers='keys', tablefmt='psql', showindex=False))
+
+    return results_list
+
+async def _search_collections(query: str, collection_names: list[str], timeouts: dict, two_stage: (bool | None), mode: QueryMode, minimum_should_match: (int | None), executor: ThreadPoolExecutor) -> dict:
+
+    '''
+    Searches every collection concurrently, each search runs in a thread of `executor` with a client of its own from the pool
+
+    Returns
+    ---------------------------------------------------
+    dictionary of collection name to its ranked pages, or to the exception that made its search fail
+    '''
+
+    def search_collection(collection_name: str) -> list[tuple]:
+        with MilvusClientPool().acquire(collection_name, timeout=timeouts[collection_name]) as db_client:
+            return _search_pages(db_client, query, two_stage, mode, minimum_should_match)
+
+    loop = asyncio.get_running_loop()
+    outcomes = await asyncio.gather(
+        *[asyncio.wait_for(loop.run_in_executor(executor, search_collection, collection_name), timeouts[collection_name]) for collection_name in collection_names],
+        return_exceptions=True
+    )
+
+    return dict(zip(collection_names, outcomes))
+
+async def federated_search_async(query: str, collection_names: list[str], snippets: bool = False, top_k: int = 10, timeout: (float | dict[str, float] | None) = None, two_stage: (bool | None) = None, mode: QueryMode = QueryMode.UNION, minimum_should_match: (int | None) = None) -> tuple[list[dict], dict]:
+
+    '''
+    Searches several collections concurrently and merges their pages into a single ranking, the page scores of all the collections
+    are computed with the same corpus token statistics so they are comparable, to be awaited from a running event loop such as a request handler
+
+    A collection whose search fails or does not complete within its timeout is left out of the results and reported in the failures,
+    the search only fails when every collection does. The searches run in threads of their own that are not waited for once their timeout expires,
+    so the call returns within the largest timeout, the search of a collection that timed out keeps its connection until it completes in the background
+
+    Parameters
+    ---------------------------------------------------
+    `query`: input query
+    `collection_names`: collections to be searched
+    `snippets`: include a highlighted snippet of the page text for the top `top_k` pages
+    `top_k`: number of pages returned across all the collections
+    `timeout`: seconds allowed for the search of each collection, either one value for all of them or a value per collection name,
+    defaults to `SEARCH.FEDERATED_TIMEOUT` of the config
+    `two_stage`, `mode`, `minimum_should_match`: see `search`
+
+    Returns
+    ---------------------------------------------------
+    (list of the top `top_k` matched pages with their collection, dictionary of the failed collection names to their error)
+    '''
+
+    default_timeout = Config().get_instance()["SEARCH"]["FEDERATED_TIMEOUT"]
+    collection_names = list(dict.fromkeys(collection_names))
+
+    if not collection_names:
+        logger.error("Must provide at least one collection to search")
+        raise ValueError("Must provide at least one collection to search")
+
+    if isinstance(timeout, dict):
+        timeouts = {collection_name: timeout.get(collection_name, default_timeout) for collection_name in collection_names}
+    else:
+        timeouts = {collection_name: default_timeout if timeout is None else timeout for collection_name in collection_names}
+
+    executor = ThreadPoolExecutor(max_workers=len(collection_names), thread_name_prefix="federated-search")
+
+    try:
+        with Profiler().stage("fetch.federated_search"):
+            outcomes = await _search_collections(query, collection_names, timeouts, two_stage, mode, minimum_should_match, executor)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    failures = dict()
+    ranked_pages = list()
+
+    for collection_name, outcome in outcomes.items():
+        if isinstance(outcome, BaseException):
+            failures[collection_name] = "timed out" if isinstance(outcome, TimeoutError) else str(outcome)
+            logger.error(f"Search of collection {collection_name} failed: {failures[collection_name]}")
+            continue
+        ranked_pages.extend((score, collection_name, key, matched_tokens) for key, score, matched_tokens in outcome)
+
+    if len(failures) == len(collection_names):
+        logger.error(f"Search failed for every collection: {failures}")
+        raise ValueError(f"Search failed for every collection: {failures}")
+
+    top_pages = heapq.nlargest(top_k, ranked_pages, key=lambda ranked_page: ranked_page[0])
+    results_list = _format_results([(key, score, matched_tokens) for score, _, key, matched_tokens in top_pages], snippets=top_k if snippets else 0)
+    results_list = [{"collection": collection_name, **result} for (_, collection_name, _, _), result in zip(top_pages, results_list)]
+
+    return results_list, failures
+
+def federated_search(query: str, collection_names: list[str], snippets: bool = False, top_k: int = 10, timeout: (float | dict[str, float] | None) = None, two_stage: (bool | None) = None, mode: QueryMode = QueryMode.UNION, minimum_should_match: (int | None) = None) -> tuple[list[dict], dict]:
+
+    '''
+    Runs `federated_search_async` in an event loop of its own and prints the merged pages and the failed collections,
+    cannot be called from a running event loop, await `federated_search_async` there instead
+
+    Returns
+    ---------------------------------------------------
+    (list of the top `top_k` matched pages with their collection, dictionary of the failed collection names to their error)
+    '''
+
+    results_list, failures = asyncio.run(federated_search_async(query, collection_names, snippets, top_k, timeout, two_stage, mode, minimum_should_match))
+
+    dataframe = pd.DataFrame.from_dict(results_list)
+    print(tabulate(dataframe, headers='keys', tablefmt='psql', showindex=False))
+    for collection_name, error in failures.items():
+        print(f"collection {collection_name} failed: {error}")
+
+    return results_list, failures
+
+def bulk_search(queries: Iterable[str], output: TextIO = sys.stdout, top_k: int = 10, chunk_size: int = BULK_CHUNK_SIZE, collection_name: (str | None) = None) -> int:
+
+    '''
+    Searches many queries at once, the normalized tokens are deduplicated across all the queries so that every unique token
+    is vectorized and searched only once, the results of each query are ranked as in `search` and written to `output` as JSON Lines
+
+    Parameters
+    ---------------------------------------------------
+    `queries`: iterable of input queries, empty queries are skipped
+    `output`: text stream to which a JSON object per query is written
+    `top_k`: number of pages written per query
+    `chunk_size`: number of queries read before their new tokens are searched
+    `collection_name`: collection to be searched, defaults to `MILVUS.TEST_COLLECTION` of the config
+
+    Returns
+    ---------------------------------------------------
+    number of queries searched
+    '''
+
+    token_hits: dict = dict()
+    queries = iter(queries)
+    query_count = 0
+
+    while chunk := [query.strip() for query in islice(queries, chunk_size)]:
+        chunk = [query for query in chunk if query]
+        query_plans = [_plan_tokens(normalize_all(query).split("_")) for query in chunk]
+
+        new_tokens = list()
+        new_vectors = list()
+        new_max_results = list()
+        new_radii = list()
+        for token, max_results, radius in dict.fromkeys(planned_token for planned_tokens in query_plans for planned_token in planned_tokens):
+            if token in token_hits:
+                continue
+            try:
+                new_vectors.append(vectorize(token))
+                new_tokens.append(token)
+                new_max_results.append(max_results)
+                new_radii.append(radius)
+            except ValueError:
+                token_hits[token] = dict()
+
+        with MilvusClientPool().acquire(collection_name) as db_client, CollectionMaintenance().loaded(db_client):
+            deduplicator = page_deduplicator(db_client.collection_name)
+            for token, hits in zip(new_tokens, _search_vectors(db_client, new_vectors, max_results=new_max_results, radii=new_radii)):
+                token_hits[token] = deduplicator.expand(hits)
+
+        for query, planned_tokens in zip(chunk, query_plans):
+            ranked_pages = _rank_pages([(token, token_hits[token]) for token, _, _ in planned_tokens])
+            output.write(json.dumps({"query": query, "results": _format_results(ranked_pages, limit=top_k)}) + "\n")
+
+        query_count += len(chunk)
+
+    output.flush()
+    return query_count
@@ -0,0 +1,136 @@
+import os
+import re
+import mmap
+import pickle
+import threading
+
+from datagen.parse_pdf import PDF
+from utils.singleton import Singleton
+from utils.logger import LogManager
+
+logger = LogManager().get_logger("fetch")
+
+class PageReader(metaclass=Singleton):
+
+    '''
+    Reads the text of a single page from the converted text files using the page index recorded at ingestion,
+    the text files are memory mapped so only the bytes of the requested page are touched
+
+    A book is opened again when its page index or text file changed since it was mapped, for instance after the book was ingested again
+    '''
+
+    def __init__(self) -> None:
+        self._books: dict = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _file_version(file_path) -> tuple:
+        file_stat = os.stat(file_path)
+        return (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    def _open_book(self, book_name: str) -> tuple:
+        index_path = PDF.page_index_path(book_name)
+
+        try:
+            index_version = PageReader._file_version(index_path)
+        except OSError:
+            logger.error(f"Page index for book '{book_name}' not found")
+            raise ValueError(f"Page index for book '{book_name}' not found")
+
+        if book_name in self._books:
+            mapped_file, page_index, text_file_path, version = self._books[book_name]
+            try:
+                if version == (index_version, PageReader._file_version(text_file_path)):
+                    return mapped_file, page_index
+            except OSError:
+                pass
+            if mapped_file is not None:
+                mapped_file.close()
+            del self._books[book_name]
+
+        try:
+            with open(index_path, "rb") as b_file:
+                text_file_path, page_index = pickle.load(b_file)
+            with open(text_file_path, "rb") as file:
+                text_version = PageReader._file_version(text_file_path)
+                mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if page_index else None
+        except (FileNotFoundError, Exception) as e:
+            logger.error(f"Page index or text file for book '{book_name}' cannot be read due to {e}")
+            raise ValueError(f"Page index or text file for book '{book_name}' cannot be read")
+
+        self._books[book_name] = (mapped_file, page_index, text_file_path, (index_version, text_version))
+        return mapped_file, page_index
+
+    def get_page(self, book_name: str, page_nm: int) -> str:
+
+        '''
+        Returns the text of a page
+
+        Parameters
+        ---------------------------------------------------
+        `book_name`: name of the book as stored in the collection
+        `page_nm`: page number as stored in the collection (relative to the first extracted page)
+
+        Returns
+        ---------------------------------------------------
+        text of the page
+        '''
+
+        with self._lock:
+            mapped_file, page_index = self._open_book(book_name)
+
+            if page_nm < 0 or page_nm >= len(page_index):
+                raise ValueError(f"Page {page_nm} does not exist in book '{book_name}'")
+
+            offset, length = page_index[page_nm]
+            page_bytes = mapped_file[offset:offset + length]
+
+        return page_bytes.decode("utf-8", errors="replace")
+
+    def get_snippet(self, book_name: str, page_nm: int, tokens: list[str], width: int = 160) -> str:
+
+        '''
+        Returns a part of the page around the first occurrence of any of the `tokens`, occurrences are highlighted with `**`
+
+        Parameters
+        ---------------------------------------------------
+        `book_name`: name of the book as stored in the collection
+        `page_nm`: page number as stored in the collection
+        `tokens`: normalized tokens to be highlighted
+        `width`: number of characters in the snippet
+
+        Returns
+        ---------------------------------------------------
+        snippet of the page
+        '''
+
+        text = " ".join(self.get_page(book_name, page_nm).split())
+        tokens = [token for token in tokens if token]
+
+        if not tokens:
+            return text[:width]
+
+        pattern = re.compile("|".join(re.escape(token) for token in sorted(tokens, key=len, reverse=True)), re.IGNORECASE)
+        match = pattern.search(text)
+
+        if match is None:
+            return text[:width]
+
+        start = max(0, match.start() - (width - len(match.group())) // 2)
+        end = min(len(text), start + width)
+        start = max(0, end - width)
+        snippet = pattern.sub(lambda m: f"**{m.group()}**", text[start:end])
+
+        return f"{'...' if start > 0 else ''}{snippet}{'...' if end < len(text) else ''}"
+
+    def close(self) -> None:
+
+        '''
+        Unmaps all the opened text files
+        '''
+
+        with self._lock:
+            for mapped_file, _, _, _ in self._books.values():
+                if mapped_file is not None:
+                    mapped_file.close()
+            self._books.clear()
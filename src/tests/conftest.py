@@ -0,0 +1,33 @@
+import sys
+import pathlib
+import tempfile
+
+import pytest
+
+SRC_DIR = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from settings.config import Config
+from utils.logger import LogManager
+
+# the shipped config with the pickle and log directories moved to a temporary directory
+_config_dict = Config(SRC_DIR / "settings" / "config.yaml").get_instance()
+_temporary_dir = pathlib.Path(tempfile.mkdtemp(prefix="docvecstore_tests_"))
+_config_dict["PICKLE_DIR"] = str(_temporary_dir)
+_config_dict["LOGGER"]["DIRECTORY"] = str(_temporary_dir)
+_config_dict["UNIGRAMS"]["FILE_PATH"] = str(SRC_DIR / "resources" / "unigrams.csv")
+_config_dict["UNIGRAMS"]["DICT_PATH"] = str(SRC_DIR / "resources" / "unigrams.pkl")
+LogManager("test")
+
+@pytest.fixture
+def near_duplicate_threshold():
+
+    '''
+    Lowers `DEDUP.NEAR_DUPLICATE_THRESHOLD` so that pages differing in a single token of a short token stream are near duplicates
+    '''
+
+    dedup_config = Config().get_instance()["DEDUP"]
+    threshold = dedup_config["NEAR_DUPLICATE_THRESHOLD"]
+    dedup_config["NEAR_DUPLICATE_THRESHOLD"] = 0.5
+    yield
+    dedup_config["NEAR_DUPLICATE_THRESHOLD"] = threshold
@@ -0,0 +1,137 @@
+import re
+import itertools
+
+import pytest
+
+from fetch import fetch
+from datagen.dedup import page_deduplicator
+
+_collection_ids = itertools.count()
+_page_clause = re.compile(r'\(book_nm == "((?:[^"\\]|\\.)*)" and page_nm in \[([\d, ]*)\]\)')
+
+BOOK = "Book One"
+OTHER_BOOK = "Book Two"
+CANONICAL_TOKENS = ["binary", "search", "tree", "insert", "delete", "balance", "rotation", "height", "node", "leaf", "root", "key"]
+
+class FakeClient:
+
+    '''
+    Collection of documents searched by exact token match, the query vectors are the tokens themselves,
+    supports the page filters built by `fetch._page_filter` and records the filters of the search requests
+    '''
+
+    def __init__(self, documents: list[tuple[str, str, int]]) -> None:
+        self.collection_name = f"conjunctive_test_{next(_collection_ids)}"
+        self.documents = documents
+        self.filters = list()
+
+    @staticmethod
+    def _pages(filter: str) -> (set | None):
+        if not filter:
+            return None
+        return {(book_name, int(page_nm)) for book_name, page_nms in _page_clause.findall(filter) for page_nm in page_nms.split(",")}
+
+    def search(self, embeddings: list, filter: str, output_fields: list, limit: int, offset: int, other_search_params: dict) -> list[list[dict]]:
+        self.filters.append(filter)
+        pages = FakeClient._pages(filter)
+        results = list()
+        for token in embeddings:
+            matches = [
+                {"entity": {"token": document_token, "book_nm": book_name, "page_nm": page_nm}}
+                for document_token, book_name, page_nm in self.documents
+                if document_token == token and (pages is None or (book_name, page_nm) in pages)
+            ]
+            results.append(matches[offset:offset + limit])
+        return results
+
+def documents(pages: dict) -> list[tuple[str, str, int]]:
+    return [(token, book_name, page_nm) for (book_name, page_nm), tokens in pages.items() for token in tokens]
+
+def plan(tokens: list[str]) -> tuple[list[tuple[str, int, float]], list[str]]:
+    return [(token, fetch.MAX_RESULTS, fetch.SEARCH_PARAMS["radius"]) for token in tokens], list(tokens)
+
+def matched_pages(token_hits: list[tuple[str, dict]]) -> set:
+    return {key for _, hits in token_hits for key in hits}
+
+@pytest.fixture
+def client():
+    return FakeClient(documents({
+        (BOOK, 1): ["graph", "shortest", "path"],
+        (BOOK, 2): ["graph", "shortest"],
+        (BOOK, 3): ["graph", "path"],
+        (BOOK, 4): ["shortest", "path"],
+        (BOOK, 5): ["graph"],
+        (BOOK, 6): ["tree"],
+    }))
+
+def test_all_tokens_must_match(client):
+    token_hits = fetch._conjunctive_search(client, *plan(["path", "shortest", "graph"]), minimum_should_match=3)
+
+    assert matched_pages(token_hits) == {(BOOK, 1)}
+    assert [token for token, _ in token_hits] == ["path", "shortest", "graph"]
+
+def test_remaining_tokens_search_candidate_pages_only(client):
+    fetch._conjunctive_search(client, *plan(["path", "shortest", "graph"]), minimum_should_match=3)
+
+    assert client.filters[0] == ""
+    assert FakeClient._pages(client.filters[1]) == {(BOOK, 1), (BOOK, 3), (BOOK, 4)}
+    assert FakeClient._pages(client.filters[2]) == {(BOOK, 1), (BOOK, 4)}
+
+def test_minimum_should_match_prunes_pages(client):
+    token_hits = fetch._conjunctive_search(client, *plan(["path", "shortest", "graph"]), minimum_should_match=2)
+
+    assert matched_pages(token_hits) == {(BOOK, 1), (BOOK, 2), (BOOK, 3), (BOOK, 4)}
+    assert len(client.filters) == 2
+    assert client.filters[0] == ""
+    assert FakeClient._pages(client.filters[1]) == {(BOOK, 1), (BOOK, 2), (BOOK, 3), (BOOK, 4)}
+
+def test_falls_back_to_union_when_no_page_qualifies(client):
+    token_hits = fetch._conjunctive_search(client, *plan(["tree", "path", "graph"]), minimum_should_match=3)
+
+    assert client.filters[0] == ""
+    assert FakeClient._pages(client.filters[1]) == {(BOOK, 6)}
+    assert client.filters[2:] == [""]
+    assert [token for token, _ in token_hits] == ["tree", "path", "graph"]
+    assert matched_pages(token_hits) == {(BOOK, 1), (BOOK, 2), (BOOK, 3), (BOOK, 4), (BOOK, 5), (BOOK, 6)}
+
+def test_minimum_should_match_is_bounded_by_the_tokens(client):
+    token_hits = fetch._conjunctive_search(client, *plan(["path", "graph"]), minimum_should_match=5)
+
+    assert matched_pages(token_hits) == {(BOOK, 1), (BOOK, 3)}
+
+def near_duplicate_client() -> FakeClient:
+
+    '''
+    Client of a collection where page 8 of `OTHER_BOOK` is a near duplicate of page 1 of `BOOK` missing its "key" token,
+    only the "successor" token it does not share with its canonical page is stored for it
+    '''
+
+    client = FakeClient(documents({
+        (BOOK, 1): CANONICAL_TOKENS,
+        (BOOK, 2): ["tree"],
+        (OTHER_BOOK, 8): ["successor"],
+    }))
+    deduplicator = page_deduplicator(client.collection_name)
+    deduplicator.begin_book(BOOK)
+    deduplicator.register(BOOK, 1, CANONICAL_TOKENS, near_duplicates=True)
+    deduplicator.begin_book(OTHER_BOOK)
+    deduplicator.register(OTHER_BOOK, 8, CANONICAL_TOKENS[:-1] + ["successor"], near_duplicates=True)
+    return client
+
+def test_aliased_pages_are_counted_and_filtered_by_their_canonical_pages(near_duplicate_threshold):
+    client = near_duplicate_client()
+
+    token_hits = fetch._conjunctive_search(client, *plan(["successor", "tree", "node"]), minimum_should_match=3)
+
+    assert matched_pages(token_hits) == {(OTHER_BOOK, 8)}
+    assert FakeClient._pages(client.filters[1]) == {(OTHER_BOOK, 8), (BOOK, 1)}
+    assert dict(token_hits)["tree"] == {(OTHER_BOOK, 8): {"tree"}}
+
+def test_alias_does_not_match_its_excluded_tokens(near_duplicate_threshold):
+    client = near_duplicate_client()
+
+    token_hits = fetch._conjunctive_search(client, *plan(["successor", "key"]), minimum_should_match=2)
+
+    assert (OTHER_BOOK, 8) not in dict(token_hits)["key"]
+    assert client.filters[-1] == ""
+    assert matched_pages(token_hits) == {(OTHER_BOOK, 8), (BOOK, 1)}
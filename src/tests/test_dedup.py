@@ -0,0 +1,131 @@
+import itertools
+
+import pytest
+
+from datagen.dedup import PageDeduplicator
+
+_collection_ids = itertools.count()
+
+BOOK_ONE = "Book One"
+BOOK_TWO = "Book Two"
+CANONICAL_TOKENS = ["binary", "search", "tree", "insert", "delete", "balance", "rotation", "height", "node", "leaf", "root", "key"]
+NEAR_DUPLICATE_TOKENS = CANONICAL_TOKENS[:-1] + ["successor"]
+
+@pytest.fixture
+def deduplicator():
+    return PageDeduplicator(f"dedup_test_{next(_collection_ids)}")
+
+def test_new_page_is_stored(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+
+    assert deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS) is None
+    assert deduplicator.register(BOOK_ONE, 1, ["graph", "edge"]) is None
+
+def test_exact_duplicate_is_aliased(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+    deduplicator.begin_book(BOOK_TWO)
+
+    canonical_key, stored_tokens = deduplicator.register(BOOK_TWO, 5, list(CANONICAL_TOKENS))
+
+    assert canonical_key == (BOOK_ONE, 0)
+    assert stored_tokens == set(CANONICAL_TOKENS)
+    assert deduplicator.stored_pages({(BOOK_TWO, 5)}) == {(BOOK_TWO, 5), (BOOK_ONE, 0)}
+
+def test_near_duplicate_is_aliased_with_excluded_tokens(deduplicator, near_duplicate_threshold):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS, near_duplicates=True)
+    deduplicator.begin_book(BOOK_TWO)
+
+    canonical_key, stored_tokens = deduplicator.register(BOOK_TWO, 3, NEAR_DUPLICATE_TOKENS, near_duplicates=True)
+
+    assert canonical_key == (BOOK_ONE, 0)
+    assert stored_tokens == set(CANONICAL_TOKENS)
+    assert deduplicator.export_book(BOOK_TWO)["aliases"][3] == ((BOOK_ONE, 0), frozenset({"key"}))
+
+def test_near_duplicates_are_ignored_when_disabled(deduplicator, near_duplicate_threshold):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+
+    assert deduplicator.register(BOOK_ONE, 1, NEAR_DUPLICATE_TOKENS) is None
+
+def test_expand_adds_aliases_without_excluded_tokens(deduplicator, near_duplicate_threshold):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS, near_duplicates=True)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 3, NEAR_DUPLICATE_TOKENS, near_duplicates=True)
+    deduplicator.register(BOOK_TWO, 4, list(CANONICAL_TOKENS), near_duplicates=True)
+
+    hits = {(BOOK_ONE, 0): {"key", "tree"}, (BOOK_TWO, 3): {"successor"}}
+    expanded_hits = deduplicator.expand(hits)
+
+    assert expanded_hits[(BOOK_ONE, 0)] == {"key", "tree"}
+    assert expanded_hits[(BOOK_TWO, 3)] == {"successor", "tree"}
+    assert expanded_hits[(BOOK_TWO, 4)] == {"key", "tree"}
+    assert hits[(BOOK_TWO, 3)] == {"successor"}
+
+def test_expand_skips_alias_matching_only_excluded_tokens(deduplicator, near_duplicate_threshold):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS, near_duplicates=True)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 3, NEAR_DUPLICATE_TOKENS, near_duplicates=True)
+
+    assert deduplicator.expand({(BOOK_ONE, 0): {"key"}}) == {(BOOK_ONE, 0): {"key"}}
+
+def test_begin_book_drops_previous_aliases(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 5, list(CANONICAL_TOKENS))
+
+    deduplicator.begin_book(BOOK_TWO)
+
+    assert deduplicator.expand({(BOOK_ONE, 0): {"tree"}}) == {(BOOK_ONE, 0): {"tree"}}
+    assert deduplicator.stored_pages({(BOOK_TWO, 5)}) == {(BOOK_TWO, 5)}
+
+def test_restore_book_keeps_aliases_of_matching_canonical_pages(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 0, ["graph", "edge"])
+    deduplicator.register(BOOK_TWO, 5, list(CANONICAL_TOKENS))
+    exported_book = deduplicator.export_book(BOOK_TWO)
+
+    target = PageDeduplicator(f"dedup_test_{next(_collection_ids)}")
+    target.begin_book(BOOK_ONE)
+    target.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+
+    assert target.restore_book(BOOK_TWO, exported_book) == []
+    assert target.expand({(BOOK_ONE, 0): {"tree"}}) == {(BOOK_ONE, 0): {"tree"}, (BOOK_TWO, 5): {"tree"}}
+    assert target.register(BOOK_ONE, 1, ["graph", "edge"])[0] == (BOOK_TWO, 0)
+
+def test_restore_book_reports_aliases_of_missing_canonical_pages(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 5, list(CANONICAL_TOKENS))
+    exported_book = deduplicator.export_book(BOOK_TWO)
+
+    missing_target = PageDeduplicator(f"dedup_test_{next(_collection_ids)}")
+    changed_target = PageDeduplicator(f"dedup_test_{next(_collection_ids)}")
+    changed_target.begin_book(BOOK_ONE)
+    changed_target.register(BOOK_ONE, 0, ["graph", "edge"])
+
+    for target in (missing_target, changed_target):
+        assert target.restore_book(BOOK_TWO, exported_book) == [5]
+        assert target.stored_pages({(BOOK_TWO, 5)}) == {(BOOK_TWO, 5)}
+        assert target.expand({(BOOK_ONE, 0): {"tree"}}) == {(BOOK_ONE, 0): {"tree"}}
+
+def test_index_is_persisted(deduplicator):
+    deduplicator.begin_book(BOOK_ONE)
+    deduplicator.register(BOOK_ONE, 0, CANONICAL_TOKENS)
+    deduplicator.begin_book(BOOK_TWO)
+    deduplicator.register(BOOK_TWO, 5, list(CANONICAL_TOKENS))
+    deduplicator.save()
+
+    reloaded = PageDeduplicator(deduplicator._collection_name)
+
+    assert reloaded.stored_pages({(BOOK_TWO, 5)}) == {(BOOK_TWO, 5), (BOOK_ONE, 0)}
+
+    reloaded.clear()
+    assert not PageDeduplicator.index_path(deduplicator._collection_name).exists()
@@ -1,15 +1,76 @@
 import os
+import time
+import queue
+import atexit
 import logging
+import threading
 
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from settings.config import Config
 from utils.singleton import Singleton
 
+class ErrorAggregator:
+
+    '''
+    Counts repeated errors raised on hot paths and logs them as periodic summaries instead of one line per occurrence,
+    the summaries are written every `interval` seconds by a background thread started with the first recorded error
+    '''
+
+    def __init__(self, logger: logging.Logger, interval: float, max_samples: int = 5) -> None:
+        self._logger = logger
+        self._interval = interval
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counts: dict = dict()
+        self._samples: dict = dict()
+        self._last_flush = time.monotonic()
+        self._stop_event = threading.Event()
+        self._flusher: (threading.Thread | None) = None
+
+    def record(self, error_type: str, sample: str) -> None:
+        with self._lock:
+            if error_type not in self._counts:
+                self._counts[error_type] = 0
+                self._samples[error_type] = list()
+            self._counts[error_type] += 1
+            if len(self._samples[error_type]) < self._max_samples:
+                self._samples[error_type].append(sample)
+
+            if self._flusher is None and not self._stop_event.is_set():
+                self._flusher = threading.Thread(target=self._flush_periodically, name="error-aggregator", daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            counts, samples = self._counts, self._samples
+            self._counts, self._samples = dict(), dict()
+            elapsed = time.monotonic() - self._last_flush
+            self._last_flush = time.monotonic()
+
+        for error_type, count in counts.items():
+            self._logger.warning(f"{error_type}: {count} occurrences in the last {elapsed:.1f}s, samples: {samples[error_type]}")
+
+    def close(self) -> None:
+
+        '''
+        Stops the background thread and logs the pending summaries
+        '''
+
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
 class LogManager(metaclass=Singleton):
 
     def __init__(self, file_name: (str | None) = None):
         '''
-        Creates a new log file with the `file_name`
+        Creates a new log file with the `file_name`, records are written by a background thread so logging does not block the caller
 
         Parameters
         ---------------------------------------------------
@@ -20,11 +81,12 @@ class LogManager(metaclass=Singleton):
         None
         '''
         try:
-            LOG_FILE_PATH = (Config().get_instance()).get('LOGGER').get('DIRECTORY')
+            logger_config = (Config().get_instance()).get('LOGGER')
+            LOG_FILE_PATH = logger_config.get('DIRECTORY')
         except (AttributeError, Exception) as e:
             print('logger file path not provided')
             return
-        
+
         file_name = f'{LOG_FILE_PATH}/{str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))}.log' if file_name is None else f'{LOG_FILE_PATH}/{file_name}.log'
 
         if os.path.isfile(file_name):
@@ -43,21 +105,58 @@ class LogManager(metaclass=Singleton):
         console_handler.setLevel(logging.ERROR)
         console_handler.setFormatter(console_formatter)
 
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+        log_queue = queue.SimpleQueue()
+        self._listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        self._listener.start()
+        self._listening = True
+
+        logger.addHandler(QueueHandler(log_queue))
 
         self.logger = logger
+        self._stage_levels = logger_config.get('LEVELS') or dict()
+        self._aggregator = ErrorAggregator(logger, logger_config.get('SUMMARY_INTERVAL', 10))
+
+        atexit.register(self.shutdown)
 
-    def get_logger(self) -> logging.Logger:
+    def get_logger(self, stage: (str | None) = None) -> logging.Logger:
         '''
         Returns the logger object
 
         Parameters
         ---------------------------------------------------
-        None
+        `stage`: name of the stage (datagen, fetch, embeddings, database ...), the level of the stage is taken from `LOGGER.LEVELS` of the config
 
         Returns
         ---------------------------------------------------
         Logger Object
         '''
-        return self.logger
+        if stage is None:
+            return self.logger
+
+        stage_logger = self.logger.getChild(stage)
+        stage_logger.setLevel(self._stage_levels.get(stage, logging.NOTSET))
+        return stage_logger
+
+    def aggregate(self, error_type: str, sample: str) -> None:
+        '''
+        Records an error from a hot path, occurrences are logged as a summary with the count and a few samples every `LOGGER.SUMMARY_INTERVAL` seconds
+
+        Parameters
+        ---------------------------------------------------
+        `error_type`: name of the error
+        `sample`: value that caused the error
+
+        Returns
+        ---------------------------------------------------
+        None
+        '''
+        self._aggregator.record(error_type, sample)
+
+    def shutdown(self) -> None:
+        '''
+        Logs the pending error summaries and waits for the queued records to be written
+        '''
+        self._aggregator.close()
+        if self._listening:
+            self._listener.stop()
+            self._listening = False
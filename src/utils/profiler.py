@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import pathlib
+import resource
+import threading
+import contextlib
+import tracemalloc
+
+from datetime import datetime
+from collections import Counter
+
+from settings.config import Config
+from utils.singleton import Singleton
+
+PROFILE_ENVIRONMENT_VARIABLE = "DOCVEC_PROFILE"
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+DISABLED_STAGE = contextlib.nullcontext()
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _StackSampler(threading.Thread):
+
+    '''
+    Samples the call stack of a thread at a fixed interval, the resident memory of the process and the memory traced by tracemalloc,
+    the traced memory is sampled rather than read from the tracemalloc peak so that nested stages do not reset the peak of the enclosing ones
+    '''
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(daemon=True)
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self.stacks: Counter = Counter()
+        self.peak_rss = _current_rss()
+        self.traced_peak = tracemalloc.get_traced_memory()[0]
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = list()
+            while frame is not None:
+                stack.append(f"{pathlib.Path(frame.f_code.co_filename).name}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            self.peak_rss = max(self.peak_rss, _current_rss())
+            self.traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[0])
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+class _ProfiledStage:
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler.start_tracing()
+        self._start_snapshot = tracemalloc.take_snapshot()
+        self._sampler = _StackSampler(threading.get_ident(), self._profiler.sample_interval)
+        self._start_time = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._sampler.stop()
+        elapsed = time.perf_counter() - self._start_time
+        end_snapshot = tracemalloc.take_snapshot()
+        traced_peak = max(self._sampler.traced_peak, tracemalloc.get_traced_memory()[0])
+        self._profiler.stop_tracing()
+
+        self._profiler.write_stage(self._name, elapsed, self._sampler, end_snapshot.compare_to(self._start_snapshot, "lineno"), traced_peak)
+        return False
+
+class Profiler(metaclass=Singleton):
+
+    '''
+    Profiles stages of the datagen and fetch runs when enabled with `PROFILING.ENABLED` of the config or the `DOCVEC_PROFILE` environment variable,
+    for every stage a sampled CPU profile as collapsed stacks (input for flamegraph tools), the top allocation sites from tracemalloc
+    and the peak resident memory are written to `<LOGGER.DIRECTORY>/profiles/<run label>`
+
+    When disabled `stage` returns a shared no-op context manager
+    '''
+
+    def __init__(self) -> None:
+        config_dict = Config().get_instance()
+        environment_value = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE)
+
+        if environment_value is not None:
+            self.enabled = environment_value.lower() not in ("", "0", "false")
+        else:
+            self.enabled = bool(config_dict["PROFILING"]["ENABLED"])
+        self.sample_interval = config_dict["PROFILING"]["SAMPLE_INTERVAL_MS"] / 1000
+        self.top_allocations = config_dict["PROFILING"]["TOP_ALLOCATIONS"]
+        self.run_label = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}"
+        self.directory = pathlib.Path(config_dict["LOGGER"]["DIRECTORY"], "profiles", self.run_label)
+        self._stage_count = 0
+        self._active_stages = 0
+        self._owns_tracing = False
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+
+        '''
+        Context manager profiling the enclosed block as the stage `name`
+
+        Parameters
+        ---------------------------------------------------
+        `name`: name of the stage, used in the names of the written files
+
+        Returns
+        ---------------------------------------------------
+        context manager
+        '''
+
+        if not self.enabled:
+            return DISABLED_STAGE
+        return _ProfiledStage(self, name)
+
+    def start_tracing(self) -> None:
+        with self._lock:
+            if self._active_stages == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            self._active_stages += 1
+
+    def stop_tracing(self) -> None:
+        with self._lock:
+            self._active_stages -= 1
+            if self._active_stages == 0 and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+
+    def write_stage(self, name: str, elapsed: float, sampler: _StackSampler, allocation_differences: list, traced_peak: int) -> None:
+        with self._lock:
+            self._stage_count += 1
+            prefix = f"{self._stage_count:03d}_{name}"
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+            with open(self.directory / f"{prefix}.collapsed", "w") as file:
+                for stack, count in sampler.stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+
+            with open(self.directory / f"{prefix}.tracemalloc.txt", "w") as file:
+                file.write(f"stage: {name}\ttraced peak: {traced_peak / 2 ** 20:.2f} MiB\n")
+                for difference in allocation_differences[:self.top_allocations]:
+                    file.write(f"{difference}\n")
+
+            summary_path = self.directory / "summary.tsv"
+            write_header = not summary_path.exists()
+            with open(summary_path, "a") as file:
+                if write_header:
+                    file.write("stage\tname\tseconds\tpeak_rss_mib\ttraced_peak_mib\tcpu_samples\n")
+                file.write(f"{prefix}\t{name}\t{elapsed:.3f}\t{sampler.peak_rss / 2 ** 20:.2f}\t{traced_peak / 2 ** 20:.2f}\t{sum(sampler.stacks.values())}\n")